@@ -0,0 +1,265 @@
+"""
+Load-test scenario drivers for the AIMedNow HTTP API.
+
+Scenarios:
+    qna         POST /api/qna with a seeded mix of emergency and general questions
+    upload_ehr  POST /api/upload_ehr with a seeded mix of doctor's-note and ordinary images
+                (--pages images per upload), then poll the job until it finishes (latency is
+                submit-to-result)
+
+By default a mock OpenAI server and the Flask app are both started in this process, so a run
+needs no network access and no API key. Pass --target to drive an already running server
+instead (point that server at a mock with OPENAI_BASE_URL).
+
+Usage:
+    python -m benchmarks.bench_api --scenario qna --requests 200 --concurrency 8
+    python -m benchmarks.bench_api --scenario all --ttft fixed:0.2 --tokens-per-sec 80 --output run.json
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import configure_app_env, memory_snapshot, summarize_latencies, write_results
+from benchmarks.mock_openai_server import NOTE_IMAGE_MARKER, build_arg_parser as mock_arg_parser, server_from_args
+
+EMERGENCY_QUESTIONS = (
+    "My father has chest pain spreading to his left arm, what should I do?",
+    "Hot oil fell on my arm and left a burn with a blister. What should I do?",
+    "Someone next to me is unconscious and not breathing normally.",
+    "My child is choking on a grape.",
+    "I was bitten by a snake on a hike an hour ago.",
+    "There is heavy bleeding from a cut on my hand that won't stop.",
+)
+
+GENERAL_QUESTIONS = (
+    "How much water should I drink every day?",
+    "What are good sources of vitamin D?",
+    "Is it better to stretch before or after running?",
+    "How many hours of sleep does a teenager need?",
+    "What is the difference between a cold and the flu?",
+    "Are eggs bad for cholesterol?",
+)
+
+
+def make_image(is_note, size=(640, 480)):
+    """
+    Build a PNG for upload. Note images carry a metadata marker the mock server recognises.
+
+    Args:
+        is_note (bool): Whether the mock should treat the image as a doctor's note
+        size (tuple): Image size in pixels
+
+    Returns:
+        bytes: PNG data
+    """
+    from PIL import Image, ImageDraw
+    from PIL.PngImagePlugin import PngInfo
+
+    image = Image.new("RGB", size, "white" if is_note else "skyblue")
+    draw = ImageDraw.Draw(image)
+    if is_note:
+        for y in range(40, size[1] - 40, 24):
+            draw.line((40, y, size[0] - 40, y), fill="black", width=2)
+    else:
+        draw.ellipse((200, 120, 440, 360), fill="green")
+    info = PngInfo()
+    if is_note:
+        info.add_text("aimednow-bench", NOTE_IMAGE_MARKER.decode("ascii"))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def _multipart(field, files, content_type="image/png"):
+    """Encode (filename, data) pairs as repeated `field` parts of a multipart/form-data body."""
+    boundary = uuid.uuid4().hex
+    body = b""
+    for filename, data in files:
+        body += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8") + data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _post(url, body, content_type, timeout):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, json.loads(response.read() or b"{}")
+
+
+def wait_for_job(target, job_id, timeout, poll_interval=0.1):
+    """Poll /api/jobs/<job_id> until the job is done or failed."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        with urllib.request.urlopen(f"{target}/api/jobs/{job_id}", timeout=timeout) as response:
+            job = json.loads(response.read())
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(poll_interval)
+    raise TimeoutError(f"Job {job_id} did not finish within {timeout}s")
+
+
+def qna_request(target, rng, emergency_ratio, timeout):
+    is_emergency = rng.random() < emergency_ratio
+    question = rng.choice(EMERGENCY_QUESTIONS if is_emergency else GENERAL_QUESTIONS)
+    body = json.dumps({"text": question}).encode("utf-8")
+
+    def call():
+        status, payload = _post(f"{target}/api/qna", body, "application/json", timeout)
+        return status, payload.get("classification")
+
+    return ("emergency" if is_emergency else "general"), call
+
+
+def upload_request(target, rng, note_ratio, timeout, images, pages=1):
+    is_note = rng.random() < note_ratio
+    name = f"bench-{uuid.uuid4().hex[:8]}"
+    body, content_type = _multipart("file", [(f"{name}-{page}.png", images[is_note]) for page in range(pages)])
+
+    def call():
+        status, payload = _post(f"{target}/api/upload_ehr", body, content_type, timeout)
+        if status != 202:
+            return status, None
+        # Uploads run as background jobs; latency is measured until the job finishes
+        job = wait_for_job(target, payload["job_id"], timeout)
+        if job["status"] != "done":
+            return 500, None
+        return 200, job["result"].get("is_doctor_note")
+
+    return ("note" if is_note else "non_note"), call
+
+
+def run_scenario(name, make_request, total, concurrency):
+    """
+    Run `total` requests through a closed-loop pool of `concurrency` workers.
+
+    Args:
+        name (str): Scenario name for progress output
+        make_request (callable): Returns (group, call) where call() performs one request
+        total (int): Number of requests
+        concurrency (int): Number of concurrent workers
+
+    Returns:
+        dict: Overall and per-group summaries plus memory usage
+    """
+    requests_to_run = [make_request() for _ in range(total)]
+    latencies = {}
+    errors = {}
+    observed = {}
+    lock = threading.Lock()
+
+    def worker(item):
+        group, call = item
+        start = time.perf_counter()
+        try:
+            status, label = call()
+            ok = status == 200
+        except (urllib.error.URLError, OSError, ValueError):
+            ok, label = False, None
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.setdefault(group, []).append(elapsed)
+                observed.setdefault(group, {}).setdefault(str(label), 0)
+                observed[group][str(label)] += 1
+            else:
+                errors[group] = errors.get(group, 0) + 1
+
+    memory_before = memory_snapshot()
+    print(f"[{name}] {total} requests, concurrency {concurrency}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, requests_to_run))
+    wall_time = time.perf_counter() - start
+
+    all_latencies = [value for group in latencies.values() for value in group]
+    summary = summarize_latencies(all_latencies, sum(errors.values()), wall_time)
+    summary["groups"] = {
+        group: dict(summarize_latencies(latencies.get(group, []), errors.get(group, 0)), observed=observed.get(group, {}))
+        for group in sorted(set(latencies) | set(errors))
+    }
+    summary["memory"] = {"before": memory_before, "after": memory_snapshot()}
+    print(f"[{name}] {summary['throughput_rps']} req/s, p50 {summary['latency_ms']['p50']} ms, "
+          f"p95 {summary['latency_ms']['p95']} ms, p99 {summary['latency_ms']['p99']} ms, errors {summary['errors']}")
+    return summary
+
+
+def start_inprocess_app():
+    """Import the Flask app (after configure_app_env) and serve it on a free local port."""
+    import os
+    import tempfile
+    from werkzeug.serving import make_server
+
+    # Keep benchmark jobs out of the app's real job database
+    os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="aimednow-bench-"), "jobs.db"))
+    import model_deployment
+
+    server = make_server("127.0.0.1", 0, model_deployment.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIMedNow API load test", parents=[mock_arg_parser(add_help=False)], conflict_handler="resolve")
+    parser.add_argument("--scenario", choices=("qna", "upload_ehr", "all"), default="all")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--emergency-ratio", type=float, default=0.3)
+    parser.add_argument("--note-ratio", type=float, default=0.5)
+    parser.add_argument("--pages", type=int, default=1, help="Images per upload (pages of one document)")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--target", help="Base URL of a running AIMedNow server (skips the in-process app and mock)")
+    parser.add_argument("--port", type=int, default=0, help="Mock server port (0 picks a free port)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Result JSON path")
+    args = parser.parse_args()
+
+    mock = app_server = None
+    target = args.target
+    if target is None:
+        mock = server_from_args(args).start()
+        configure_app_env(mock.base_url)
+        app_server, target = start_inprocess_app()
+        print(f"Mock OpenAI at {mock.base_url}, app at {target}")
+
+    rng = random.Random(args.seed)
+    results = {}
+    try:
+        if args.scenario in ("qna", "all"):
+            results["qna"] = run_scenario(
+                "qna",
+                lambda: qna_request(target, rng, args.emergency_ratio, args.timeout),
+                args.requests,
+                args.concurrency,
+            )
+        if args.scenario in ("upload_ehr", "all"):
+            images = {True: make_image(True), False: make_image(False)}
+            results["upload_ehr"] = run_scenario(
+                "upload_ehr",
+                lambda: upload_request(target, rng, args.note_ratio, args.timeout, images, args.pages),
+                args.requests,
+                args.concurrency,
+            )
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        if mock is not None:
+            results["mock_server"] = dict(mock.stats)
+            mock.stop()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("api", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Cold-start benchmark: import time of model_deployment and time to the first emergency answer,
+each measured in a fresh interpreter against the mock OpenAI server.
+
+Modes:
+    snapshot     GraphRAG index loaded from the precompiled snapshot (built by an uncounted warm-up run)
+    no_snapshot  GraphRAG index parsed from parquet through the read_indexer_* adapters
+
+To measure a commit that predates this script, check it out in a separate worktree and point
+--app-dir at it; the harness and mock come from this checkout, only the child interpreters import
+the app from --app-dir. Trees without the snapshot support only have the no_snapshot mode.
+
+Usage:
+    python -m benchmarks.bench_cold_start --runs 5
+    python -m benchmarks.bench_cold_start --mode no_snapshot --runs 3
+
+    # Before/after the lazy-import and snapshot change (a0718cb)
+    git worktree add /tmp/aimednow-before a0718cb^
+    python -m benchmarks.bench_cold_start --app-dir /tmp/aimednow-before --mode no_snapshot --output before.json
+    python -m benchmarks.bench_cold_start --mode both --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import DEFAULT_INPUT_DIR, REPO_ROOT, git_commit, summarize_latencies, write_results
+from benchmarks.mock_openai_server import ModelProfile, MockOpenAIServer
+
+# Runs in the child interpreter; prints one JSON line with its timings
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import model_deployment
+imported = time.perf_counter()
+from emergency_classifier import process_question_sync
+result = process_question_sync(sys.argv[1])
+answered = time.perf_counter()
+print("BENCH " + json.dumps({
+    "import_s": imported - start,
+    "first_emergency_s": answered - start,
+    "classification": result["classification"],
+}))
+"""
+
+QUESTION = "My father has chest pain spreading to his left arm, what should I do?"
+
+
+def run_child(env, app_dir):
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, QUESTION],
+        cwd=app_dir, env=env, capture_output=True, text=True, timeout=600,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("BENCH "):
+            return json.loads(line[len("BENCH "):])
+    raise RuntimeError(f"Cold-start child failed:\n{completed.stdout}\n{completed.stderr}")
+
+
+def bench_mode(mode, args, base_env):
+    env = dict(base_env)
+    env["GRAPHRAG_USE_SNAPSHOT"] = "1" if mode == "snapshot" else "0"
+    if mode == "snapshot":
+        # Uncounted run that builds the snapshot if it is missing or stale
+        run_child(env, args.app_dir)
+
+    import_times = []
+    first_answer_times = []
+    classifications = {}
+    for _ in range(args.runs):
+        timings = run_child(env, args.app_dir)
+        import_times.append(timings["import_s"])
+        first_answer_times.append(timings["first_emergency_s"])
+        classifications[timings["classification"]] = classifications.get(timings["classification"], 0) + 1
+
+    results = {
+        f"{mode}.import": summarize_latencies(import_times),
+        f"{mode}.first_emergency_answer": summarize_latencies(first_answer_times),
+    }
+    results[f"{mode}.first_emergency_answer"]["classifications"] = classifications
+    print(f"[{mode}] import p50 {results[f'{mode}.import']['latency_ms']['p50']} ms, first emergency answer "
+          f"p50 {results[f'{mode}.first_emergency_answer']['latency_ms']['p50']} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIMedNow cold-start benchmark")
+    parser.add_argument("--mode", choices=("snapshot", "no_snapshot", "both"), default="both")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--input-dir", default=DEFAULT_INPUT_DIR)
+    parser.add_argument("--app-dir", default=REPO_ROOT,
+                        help="Checkout whose model_deployment is imported, e.g. a worktree of an older commit")
+    parser.add_argument("--ttft", default="fixed:0.0", help="Mock latency; 0 isolates startup cost from API latency")
+    parser.add_argument("--output", help="Result JSON path")
+    args = parser.parse_args()
+
+    mock = MockOpenAIServer(default_profile=ModelProfile(ttft=args.ttft, tokens_per_sec=0, completion_tokens=50)).start()
+    snapshot_dir = tempfile.mkdtemp(prefix="aimednow-cold-start-")
+    base_env = dict(
+        os.environ,
+        OPENAI_BASE_URL=mock.base_url,
+        GRAPHRAG_API_BASE=mock.base_url,
+        GRAPHRAG_API_KEY=os.environ.get("GRAPHRAG_API_KEY", "sk-mock"),
+        MODEL_NAME="gpt-4o",
+        GRAPHRAG_LLM_MODEL="gpt-4o",
+        GRAPHRAG_EMBEDDING_MODEL="text-embedding-ada-002",
+        GRAPHRAG_INPUT_DIR=args.input_dir,
+        GRAPHRAG_SNAPSHOT_PATH=os.path.join(snapshot_dir, "index_snapshot.pkl"),
+        JOB_DB_PATH=os.path.join(snapshot_dir, "jobs.db"),
+    )
+
+    results = {}
+    try:
+        modes = ("no_snapshot", "snapshot") if args.mode == "both" else (args.mode,)
+        for mode in modes:
+            results.update(bench_mode(mode, args, base_env))
+    finally:
+        mock.stop()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    app_dir = os.path.abspath(args.app_dir)
+    write_results("cold_start", config, results, args.output,
+                  commit=None if app_dir == os.path.abspath(REPO_ROOT) else git_commit(app_dir))
+
+
+if __name__ == "__main__":
+    main()
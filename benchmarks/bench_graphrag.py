@@ -0,0 +1,126 @@
+"""
+Micro-benchmarks for GraphRAGSearchEngine against the indexed EMT data in grag/docs/output-us-emt.
+
+Measures:
+    setup    Building a GraphRAGSearchEngine (index snapshot load, or parquet reads and
+             read_indexer_* adapters with --no-snapshot; LanceDB connection, model setup),
+             repeated --setup-runs times
+    context  LocalSearchMixedContext.build_context for a set of emergency questions (LanceDB
+             entity lookup plus context assembly); query embeddings come from the mock server
+
+Usage:
+    python -m benchmarks.bench_graphrag --setup-runs 5 --context-runs 20
+"""
+import argparse
+import asyncio
+import gc
+import time
+
+from benchmarks.common import DEFAULT_INPUT_DIR, configure_app_env, memory_snapshot, summarize_latencies, write_results
+from benchmarks.mock_openai_server import ModelProfile, MockOpenAIServer
+
+CONTEXT_QUERIES = (
+    "How do I treat a minor burn at home?",
+    "What to do if I was bitten by a snake",
+    "How should I position someone who is unconscious but breathing?",
+    "What are the steps of CPR for an adult?",
+    "How do I control severe bleeding from the leg?",
+)
+
+
+def build_engine(input_dir, community_level, llm_model, embedding_model, use_snapshot):
+    from grag.graphrag_search import GraphRAGSearchEngine
+
+    return GraphRAGSearchEngine(
+        input_dir=input_dir,
+        community_level=community_level,
+        llm_model=llm_model,
+        embedding_model=embedding_model,
+        use_covariates=False,
+        use_snapshot=use_snapshot,
+    )
+
+
+def bench_setup(args):
+    """Time engine construction; the first run also pays the graphrag/pandas import cost."""
+    import_start = time.perf_counter()
+    import grag.graphrag_search  # noqa: F401
+    import_time = time.perf_counter() - import_start
+
+    latencies = []
+    memory_before = memory_snapshot()
+    engine = None
+    for _ in range(args.setup_runs):
+        engine = None
+        gc.collect()
+        start = time.perf_counter()
+        engine = build_engine(args.input_dir, args.community_level, args.llm_model, args.embedding_model,
+                              use_snapshot=not args.no_snapshot)
+        latencies.append(time.perf_counter() - start)
+    summary = summarize_latencies(latencies)
+    summary["import_ms"] = round(import_time * 1000.0, 2)
+    summary["memory"] = {"before": memory_before, "after": memory_snapshot()}
+    print(f"[setup] import {summary['import_ms']} ms, p50 {summary['latency_ms']['p50']} ms, "
+          f"max {summary['latency_ms']['max']} ms")
+    return summary, engine
+
+
+def bench_context(args, engine):
+    """Time build_context for each query, as LocalSearch.search would call it."""
+    context_builder = engine.search_engine.context_builder
+    params = dict(engine.search_engine.context_builder_params)
+    latencies = []
+    context_tokens = []
+    memory_before = memory_snapshot()
+    for i in range(args.context_runs):
+        query = CONTEXT_QUERIES[i % len(CONTEXT_QUERIES)]
+        start = time.perf_counter()
+        result = context_builder.build_context(query=query, conversation_history=None, **params)
+        latencies.append(time.perf_counter() - start)
+        if asyncio.iscoroutine(result):
+            raise RuntimeError("build_context is async in this graphrag version; benchmark needs updating")
+        chunks = getattr(result, "context_chunks", None)
+        if isinstance(chunks, str):
+            context_tokens.append(len(engine.search_engine.token_encoder.encode(chunks)))
+    summary = summarize_latencies(latencies)
+    if context_tokens:
+        summary["mean_context_tokens"] = round(sum(context_tokens) / len(context_tokens), 1)
+    summary["memory"] = {"before": memory_before, "after": memory_snapshot()}
+    print(f"[context] p50 {summary['latency_ms']['p50']} ms, p95 {summary['latency_ms']['p95']} ms, "
+          f"p99 {summary['latency_ms']['p99']} ms")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GraphRAGSearchEngine micro-benchmarks")
+    parser.add_argument("--input-dir", default=DEFAULT_INPUT_DIR)
+    parser.add_argument("--community-level", type=int, default=2)
+    parser.add_argument("--llm-model", default="gpt-4o")
+    parser.add_argument("--embedding-model", default="text-embedding-ada-002")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--embedding-latency", default="fixed:0.0", help="Mock embedding latency distribution")
+    parser.add_argument("--setup-runs", type=int, default=3)
+    parser.add_argument("--no-snapshot", action="store_true", help="Always parse the parquet files instead of loading the index snapshot")
+    parser.add_argument("--context-runs", type=int, default=20)
+    parser.add_argument("--output", help="Result JSON path")
+    args = parser.parse_args()
+
+    mock = MockOpenAIServer(
+        default_profile=ModelProfile(ttft=args.embedding_latency, tokens_per_sec=0),
+        embedding_dim=args.embedding_dim,
+    ).start()
+    configure_app_env(mock.base_url, graphrag_model=args.llm_model,
+                      embedding_model=args.embedding_model, input_dir=args.input_dir)
+    try:
+        results = {}
+        results["setup"], engine = bench_setup(args)
+        results["context"] = bench_context(args, engine)
+    finally:
+        mock.stop()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("graphrag", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
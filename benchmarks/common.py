@@ -0,0 +1,158 @@
+"""
+Shared helpers for the AIMedNow benchmarks: latency statistics, memory sampling, pointing the
+app at the mock server, and writing results as JSON for comparison across commits.
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+DEFAULT_INPUT_DIR = os.path.join(REPO_ROOT, "grag", "docs", "output-us-emt")
+
+
+def percentile(values, pct):
+    """
+    Linear-interpolated percentile of a list of numbers.
+
+    Args:
+        values (list): Sample values
+        pct (float): Percentile in [0, 100]
+
+    Returns:
+        float: The percentile, or None for an empty sample
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_latencies(latencies, errors=0, wall_time=None):
+    """
+    Summarize per-request latencies (seconds) into the fields stored in result files.
+
+    Args:
+        latencies (list): Latencies of successful requests in seconds
+        errors (int): Number of failed requests
+        wall_time (float, optional): Elapsed time of the whole run, used for throughput
+
+    Returns:
+        dict: Counts, throughput and latency percentiles in milliseconds
+    """
+    summary = {
+        "requests": len(latencies) + errors,
+        "successes": len(latencies),
+        "errors": errors,
+        "latency_ms": {
+            "mean": _ms(sum(latencies) / len(latencies)) if latencies else None,
+            "min": _ms(min(latencies)) if latencies else None,
+            "p50": _ms(percentile(latencies, 50)),
+            "p95": _ms(percentile(latencies, 95)),
+            "p99": _ms(percentile(latencies, 99)),
+            "max": _ms(max(latencies)) if latencies else None,
+        },
+    }
+    if wall_time:
+        summary["wall_time_s"] = round(wall_time, 3)
+        summary["throughput_rps"] = round(len(latencies) / wall_time, 3)
+    return summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000.0, 2)
+
+
+def memory_snapshot():
+    """
+    Current and peak resident memory of this process in MB.
+
+    Returns:
+        dict: {"rss_mb": ..., "peak_rss_mb": ...}; rss_mb is None where /proc is unavailable
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    rss_mb = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        rss_mb = rss_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    return {
+        "rss_mb": None if rss_mb is None else round(rss_mb, 1),
+        "peak_rss_mb": round(peak_mb, 1),
+    }
+
+
+def git_commit(path=REPO_ROOT):
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=path, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def configure_app_env(base_url, model="gpt-4o", graphrag_model="gpt-4o", embedding_model="text-embedding-ada-002",
+                      input_dir=DEFAULT_INPUT_DIR):
+    """
+    Point every OpenAI client the app creates at the mock server.
+
+    Call it before the app's first LLM call: the shared llm_client and the GraphRAG engine
+    are created lazily on first use and read these variables then.
+    """
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["GRAPHRAG_API_BASE"] = base_url
+    os.environ.setdefault("GRAPHRAG_API_KEY", "sk-mock")
+    os.environ["MODEL_NAME"] = model
+    os.environ["GRAPHRAG_LLM_MODEL"] = graphrag_model
+    os.environ["GRAPHRAG_EMBEDDING_MODEL"] = embedding_model
+    os.environ["GRAPHRAG_INPUT_DIR"] = input_dir
+    # Every benchmark request comes from one address; per-client limits would only measure 429s
+    os.environ.setdefault("CLIENT_RPM_LIMIT", "0")
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+
+def write_results(name, config, results, output=None, commit=None):
+    """
+    Write a benchmark run to JSON.
+
+    Args:
+        name (str): Benchmark name, used in the default file name
+        config (dict): Parameters of the run (concurrency, mock profile, ...)
+        results (dict): Scenario name -> summary dict
+        output (str, optional): Output path (defaults to benchmarks/results/{name}-{commit}-{time}.json)
+        commit (str, optional): Commit of the code under test, if not this checkout's HEAD
+
+    Returns:
+        str: Path of the written file
+    """
+    commit = commit or git_commit()
+    payload = {
+        "benchmark": name,
+        "git_commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{name}-{commit}-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Results written to {output}")
+    return output
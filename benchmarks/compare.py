@@ -0,0 +1,87 @@
+"""
+Compare two benchmark result files and flag latency/throughput regressions.
+
+Usage:
+    python -m benchmarks.compare benchmarks/results/api-abc123-....json benchmarks/results/api-def456-....json
+    python -m benchmarks.compare base.json new.json --threshold 10
+
+Exits with status 1 if any p50/p95/p99 latency grew, or throughput dropped, by more than
+--threshold percent.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50", "p95", "p99")
+
+
+def _pct_change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100.0
+
+
+def compare_results(base, new, threshold):
+    """
+    Compare matching scenarios of two result payloads.
+
+    Args:
+        base (dict): Baseline result file contents
+        new (dict): Candidate result file contents
+        threshold (float): Allowed regression in percent
+
+    Returns:
+        tuple: (rows, regressions) where rows are (scenario, metric, old, new, change%) tuples
+    """
+    rows = []
+    regressions = []
+    for scenario, new_summary in new.get("results", {}).items():
+        base_summary = base.get("results", {}).get(scenario)
+        if not isinstance(new_summary, dict) or not isinstance(base_summary, dict):
+            continue
+        for key in LATENCY_KEYS:
+            old_value = (base_summary.get("latency_ms") or {}).get(key)
+            new_value = (new_summary.get("latency_ms") or {}).get(key)
+            change = _pct_change(old_value, new_value)
+            row = (scenario, f"{key} ms", old_value, new_value, change)
+            rows.append(row)
+            if change is not None and change > threshold:
+                regressions.append(row)
+        if "throughput_rps" in new_summary and "throughput_rps" in base_summary:
+            change = _pct_change(base_summary["throughput_rps"], new_summary["throughput_rps"])
+            row = (scenario, "throughput rps", base_summary["throughput_rps"], new_summary["throughput_rps"], change)
+            rows.append(row)
+            if change is not None and change < -threshold:
+                regressions.append(row)
+        old_peak = ((base_summary.get("memory") or {}).get("after") or {}).get("peak_rss_mb")
+        new_peak = ((new_summary.get("memory") or {}).get("after") or {}).get("peak_rss_mb")
+        if old_peak is not None and new_peak is not None:
+            rows.append((scenario, "peak rss MB", old_peak, new_peak, _pct_change(old_peak, new_peak)))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two AIMedNow benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"base {base.get('git_commit')} ({base.get('timestamp')}) -> new {new.get('git_commit')} ({new.get('timestamp')})")
+    rows, regressions = compare_results(base, new, args.threshold)
+    for scenario, metric, old_value, new_value, change in rows:
+        change_text = "n/a" if change is None else f"{change:+.1f}%"
+        print(f"{scenario:<14} {metric:<16} {str(old_value):>12} -> {str(new_value):<12} {change_text}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
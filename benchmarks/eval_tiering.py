@@ -0,0 +1,193 @@
+"""
+Quality/latency/cost evaluation of the model tiering policy (model_tiering.py).
+
+Runs every fixture in benchmarks/fixtures/tiering_cases.json through simplify_medical_text
+(notes) and get_general_response (questions), once with tiering enabled and once with
+MODEL_TIERING=0 (everything on MODEL_NAME, the previous behaviour). By default it runs against
+the mock server with a slow large model and a fast small model, which measures routing, latency,
+cost and truncation but not answer quality. Pass --base-url to run against real models on an
+OpenAI-compatible endpoint (key from GRAPHRAG_API_KEY), where med_retention measures what the
+simplifications actually kept.
+
+Reported per policy and task:
+    tier_agreement   Share of cases routed to the tier the fixture expects (a routing check,
+                     not a quality measure: the fixtures were labelled with the same policy)
+    med_retention    Share of the fixture's medications whose name and dose appear in the
+                     simplified note (notes only; output-based quality check). The mock echoes
+                     the note, so against it this only catches content lost to cut-off answers
+                     that the continuation loop failed to recover
+    truncation_rate  Share of completions cut off by max_tokens (quality proxy for tight caps)
+    small_share      Share of cases served by the small model
+    latency_ms       End-to-end latency of the call, as in other benchmark results
+    cost_usd         Estimated spend from metrics.MODEL_PRICING, total and per case
+
+Usage:
+    python -m benchmarks.eval_tiering
+    python -m benchmarks.eval_tiering --large-model gpt-4o --model-profiles profiles.json --repeats 3
+    python -m benchmarks.eval_tiering --base-url https://api.openai.com/v1 --large-model gpt-4o --small-model gpt-4o-mini
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from benchmarks.common import REPO_ROOT, configure_app_env, summarize_latencies, write_results
+from benchmarks.mock_openai_server import ModelProfile, MockOpenAIServer
+
+DEFAULT_FIXTURES = os.path.join(REPO_ROOT, "benchmarks", "fixtures", "tiering_cases.json")
+POLICIES = {"tiered": "1", "large_only": "0"}
+
+
+def default_profiles(large_model, small_model):
+    # Completion length grows with the prompt so long notes produce long simplifications
+    return {
+        large_model: ModelProfile(ttft="lognormal:0.5:0.3", tokens_per_sec=40, completion_tokens=150,
+                                  completion_per_prompt_token=1.0),
+        small_model: ModelProfile(ttft="lognormal:0.25:0.3", tokens_per_sec=120, completion_tokens=150,
+                                  completion_per_prompt_token=1.0),
+    }
+
+
+def _normalize(text):
+    # Case- and spacing-insensitive, so "500mg" matches "500 mg"
+    return "".join(text.lower().split())
+
+
+def missing_medications(output, medications):
+    """
+    Medications from a fixture that the output lost: none of their names, or not their dose.
+
+    Args:
+        output (str): The simplified note
+        medications (list): Fixture entries {"names": [...], "dose": str or None}
+
+    Returns:
+        list: "name dose" of each medication not found in the output
+    """
+    text = _normalize(output)
+    missing = []
+    for medication in medications:
+        found = any(_normalize(name) in text for name in medication["names"])
+        if medication["dose"]:
+            found = found and _normalize(medication["dose"]) in text
+        if not found:
+            missing.append(" ".join(filter(None, [medication["names"][0], medication["dose"]])))
+    return missing
+
+
+def run_case(task, case):
+    """Run one fixture and read its tier, cost and truncation back from the metrics registry."""
+    from metrics import registry
+
+    registry.reset()
+    start = time.perf_counter()
+    error = False
+    output = ""
+    if task == "simplify":
+        from doctor_note_processor import simplify_medical_text
+        try:
+            output = simplify_medical_text(case["text"])["simplified"]
+        except Exception as e:
+            print(f"[{case['id']}] error: {e}")
+            error = True
+    else:
+        from emergency_classifier import emergency_system
+        is_fallback = case.get("classification") == "emergency-fallback"
+        result = asyncio.run(emergency_system.get_general_response(case["question"], is_fallback=is_fallback))
+        error = result["source"] == "error"
+    latency = time.perf_counter() - start
+
+    return {
+        "latency": latency,
+        "error": error,
+        "tier": "small" if registry.counter_total("aimednow_model_tier_total", tier="small") else "large",
+        "truncated": registry.counter_total("aimednow_llm_truncated_total") > 0,
+        "cost": registry.counter_total("aimednow_llm_cost_usd_total"),
+        "medications": len(case.get("medications", [])),
+        "missing_medications": missing_medications(output, case.get("medications", [])),
+    }
+
+
+def evaluate(task, cases, repeats):
+    outcomes = []
+    for _ in range(repeats):
+        for case in cases:
+            outcome = run_case(task, case)
+            outcome["expected_tier"] = case["expected_tier"]
+            outcome["id"] = case["id"]
+            outcomes.append(outcome)
+
+    ok = [o for o in outcomes if not o["error"]]
+    summary = summarize_latencies([o["latency"] for o in ok], errors=len(outcomes) - len(ok))
+    total_cost = sum(o["cost"] for o in ok)
+    checked = [o for o in ok if o["medications"]]
+    summary.update({
+        "med_retention": round(
+            sum(o["medications"] - len(o["missing_medications"]) for o in checked)
+            / sum(o["medications"] for o in checked), 3
+        ) if checked else None,
+        "missing_medications": {o["id"]: o["missing_medications"] for o in checked if o["missing_medications"]},
+        "tier_agreement": round(sum(o["tier"] == o["expected_tier"] for o in outcomes) / len(outcomes), 3),
+        "truncation_rate": round(sum(o["truncated"] for o in ok) / len(ok), 3) if ok else None,
+        "small_share": round(sum(o["tier"] == "small" for o in outcomes) / len(outcomes), 3),
+        "cost_usd": round(total_cost, 6),
+        "cost_usd_per_case": round(total_cost / len(ok), 6) if ok else None,
+        "disagreements": sorted({o["id"] for o in outcomes if o["tier"] != o["expected_tier"]}),
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the model tiering policy against the mock server")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--large-model", default="gpt-4o")
+    parser.add_argument("--small-model", default="gpt-4o-mini")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint serving the real models (skips the mock)")
+    parser.add_argument("--model-profiles", help="JSON file mapping model name -> profile fields, replaces the defaults")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Result JSON path")
+    args = parser.parse_args()
+
+    with open(args.fixtures) as f:
+        fixtures = json.load(f)
+    mock = None
+    profiles = {}
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+        os.environ["MODEL_NAME"] = args.large_model
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+    else:
+        if args.model_profiles:
+            with open(args.model_profiles) as f:
+                profiles = {name: ModelProfile.from_dict(data) for name, data in json.load(f).items()}
+        else:
+            profiles = default_profiles(args.large_model, args.small_model)
+        mock = MockOpenAIServer(default_profile=profiles[args.large_model], model_profiles=profiles, seed=args.seed).start()
+        configure_app_env(mock.base_url, model=args.large_model)
+    os.environ["SMALL_MODEL_NAME"] = args.small_model
+
+    results = {}
+    try:
+        for policy, enabled in POLICIES.items():
+            os.environ["MODEL_TIERING"] = enabled
+            for task, cases in (("simplify", fixtures["notes"]), ("general", fixtures["questions"])):
+                summary = evaluate(task, cases, args.repeats)
+                results[f"{policy}.{task}"] = summary
+                print(f"[{policy}.{task}] agreement {summary['tier_agreement']}, med retention {summary['med_retention']}, "
+                      f"truncation {summary['truncation_rate']}, "
+                      f"p50 {summary['latency_ms']['p50']} ms, cost ${summary['cost_usd']}")
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    config["profiles"] = {name: profile.to_dict() for name, profile in profiles.items()}
+    write_results("tiering", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
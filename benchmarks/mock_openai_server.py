@@ -0,0 +1,428 @@
+"""
+Local OpenAI-compatible mock server for benchmarking AIMedNow without spending API quota.
+
+Serves /v1/chat/completions (plain and streamed), /v1/embeddings and /v1/models. Each model
+gets a latency profile: time to first token drawn from a configurable distribution, a token
+generation rate, a completion length, and an error injection rate. Responses are shaped so
+the app's routing still works: triage prompts get "emergency"/"non-emergency", document checks
+get YES/NO, and benchmark images tagged as notes are described as clinical notes. Prompts that
+quote an "Original text:" (note simplification) get that text back before the filler words, so
+output checks such as medication retention see what a cut-off answer would lose.
+
+Usage:
+    python -m benchmarks.mock_openai_server --port 8001 --ttft lognormal:0.4:0.3 --tokens-per-sec 60
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python model_deployment.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Marker embedded in PNG metadata by the benchmark drivers to tag images that should be
+# treated as doctor's notes
+NOTE_IMAGE_MARKER = b"aimednow-bench:doctor-note"
+NOTE_DESCRIPTION = "A handwritten clinical note listing a diagnosis, two medications with dosages and follow-up instructions."
+PHOTO_DESCRIPTION = "A photo of a city park on a sunny afternoon with trees, a bench and a walking path."
+
+# Words that make the mock triage model answer "emergency"
+EMERGENCY_HINTS = (
+    "bleeding", "burn", "chest pain", "choking", "unconscious", "not breathing", "seizure",
+    "snake", "overdose", "stroke", "broken", "fracture", "allergic reaction", "poison",
+)
+
+LOREM_WORDS = (
+    "patient", "should", "rest", "drink", "fluids", "take", "medication", "daily", "with", "food",
+    "monitor", "symptoms", "follow", "up", "doctor", "week", "avoid", "heavy", "lifting", "call",
+    "if", "pain", "gets", "worse", "the", "and", "a", "to", "of", "for",
+)
+
+
+def parse_distribution(spec):
+    """
+    Parse a latency distribution spec into a zero-argument sampler returning seconds.
+
+    Supported specs: "fixed:S", "uniform:LO:HI", "normal:MEAN:STD", "lognormal:MEDIAN:SIGMA".
+
+    Args:
+        spec (str): The distribution spec
+
+    Returns:
+        callable: Sampler returning a non-negative number of seconds
+    """
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        import math
+        mu = math.log(params[0]) if params[0] > 0 else 0.0
+        return lambda: random.lognormvariate(mu, params[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class ModelProfile:
+    """
+    Latency, throughput and error behaviour of one mocked model.
+
+    Args:
+        ttft (str): Time-to-first-token distribution spec (see parse_distribution)
+        tokens_per_sec (float): Completion token generation rate, 0 for instant
+        completion_tokens (int): Tokens generated for free-text answers (capped by max_tokens)
+        completion_per_prompt_token (float): Extra completion tokens per prompt token, so longer
+            inputs (e.g. notes to simplify) get longer answers
+        error_rate (float): Fraction of requests that fail
+        error_codes (tuple): HTTP status codes to pick from when a request fails
+    """
+
+    def __init__(self, ttft="fixed:0.2", tokens_per_sec=50.0, completion_tokens=300,
+                 error_rate=0.0, error_codes=(429, 500, 503), completion_per_prompt_token=0.0):
+        self.ttft_spec = ttft
+        self.ttft = parse_distribution(ttft)
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.completion_per_prompt_token = completion_per_prompt_token
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+
+    def to_dict(self):
+        return {
+            "ttft": self.ttft_spec,
+            "tokens_per_sec": self.tokens_per_sec,
+            "completion_tokens": self.completion_tokens,
+            "completion_per_prompt_token": self.completion_per_prompt_token,
+            "error_rate": self.error_rate,
+            "error_codes": list(self.error_codes),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _count_tokens(text):
+    # Rough OpenAI-style estimate, good enough for usage accounting in a mock
+    return max(1, len(text) // 4)
+
+
+def _message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(item.get("text", "") for item in content if item.get("type") == "text")
+    return "\n".join(parts)
+
+
+def _answer_words(messages, n_tokens):
+    """
+    Words of a free-text answer: the prompt's "Original text:" (if any) echoed back, then filler.
+    Continuation requests pick up after the words earlier assistant turns already returned.
+    """
+    echo = []
+    for message in messages:
+        content = message.get("content")
+        if message.get("role") == "user" and isinstance(content, str) and "Original text:" in content:
+            echo = content.split("Original text:", 1)[1].split()
+            break
+    offset = sum(len((m.get("content") or "").split()) for m in messages if m.get("role") == "assistant")
+    return [
+        echo[offset + i] if offset + i < len(echo) else random.choice(LOREM_WORDS)
+        for i in range(n_tokens)
+    ]
+
+
+def _has_note_image(messages):
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for item in content:
+            if item.get("type") != "image_url":
+                continue
+            url = item["image_url"]["url"]
+            data = url.split(",", 1)[1] if "," in url else url
+            try:
+                if NOTE_IMAGE_MARKER in base64.b64decode(data):
+                    return True
+            except ValueError:
+                pass
+    return False
+
+
+def _has_image(messages):
+    return any(
+        isinstance(m.get("content"), list) and any(i.get("type") == "image_url" for i in m["content"])
+        for m in messages
+    )
+
+
+class MockOpenAIServer:
+    """
+    Threaded HTTP server speaking enough of the OpenAI API for AIMedNow and GraphRAG.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free port
+        default_profile (ModelProfile): Profile used for models without an override
+        model_profiles (dict, optional): Model name -> ModelProfile overrides
+        embedding_dim (int): Dimension of returned embedding vectors
+        seed (int, optional): Seed for latency sampling and error injection
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, default_profile=None, model_profiles=None,
+                 embedding_dim=1536, seed=None):
+        self.default_profile = default_profile or ModelProfile()
+        self.model_profiles = dict(model_profiles or {})
+        self.embedding_dim = embedding_dim
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "by_model": {}}
+        if seed is not None:
+            random.seed(seed)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def profile_for(self, model):
+        return self.model_profiles.get(model, self.default_profile)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _record(self, model, prompt_tokens, completion_tokens, error=False):
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            per_model = self.stats["by_model"].setdefault(model, {"requests": 0, "completion_tokens": 0})
+            per_model["requests"] += 1
+            per_model["completion_tokens"] += completion_tokens
+
+    def completion_text(self, body):
+        """Pick a response that keeps the app's routing logic on its normal paths."""
+        messages = body.get("messages", [])
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system" and isinstance(m.get("content"), str))
+        user_text = _message_text([m for m in messages if m.get("role") != "system"])
+
+        if "triage" in system:
+            lowered = user_text.lower()
+            return "emergency" if any(hint in lowered for hint in EMERGENCY_HINTS) else "non-emergency"
+        if "identifies medical documentation" in system:
+            return "YES" if "clinical note" in user_text else "NO"
+        if _has_image(messages) and "OCR" not in system:
+            return NOTE_DESCRIPTION if _has_note_image(messages) else PHOTO_DESCRIPTION
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    models = sorted(set(server.model_profiles) | {"mock"})
+                    self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in models]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                body = self._read_body()
+                if self.path.endswith("/chat/completions"):
+                    self._chat(body)
+                elif self.path.endswith("/embeddings"):
+                    self._embeddings(body)
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def _maybe_fail(self, model, profile):
+                if profile.error_rate and random.random() < profile.error_rate:
+                    status = random.choice(profile.error_codes)
+                    server._record(model, 0, 0, error=True)
+                    self._send_json(status, {"error": {"message": "Injected error", "type": "mock_error", "code": status}})
+                    return True
+                return False
+
+            def _chat(self, body):
+                model = body.get("model") or "mock"
+                profile = server.profile_for(model)
+                if self._maybe_fail(model, profile):
+                    return
+
+                prompt_tokens = _count_tokens(_message_text(body.get("messages", [])))
+                max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+                text = server.completion_text(body)
+                if text is None:
+                    wanted = profile.completion_tokens + int(profile.completion_per_prompt_token * prompt_tokens)
+                    n_tokens = min(wanted, max_tokens) if max_tokens else wanted
+                    words = _answer_words(body.get("messages", []), n_tokens)
+                    finish_reason = "length" if max_tokens and wanted > max_tokens else "stop"
+                else:
+                    words = text.split(" ")
+                    finish_reason = "stop"
+                completion_tokens = len(words)
+
+                time.sleep(profile.ttft())
+                per_token = 1.0 / profile.tokens_per_sec if profile.tokens_per_sec else 0.0
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+                created = int(time.time())
+
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    for i, word in enumerate(words):
+                        if per_token:
+                            time.sleep(per_token)
+                        chunk = {
+                            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                            "choices": [{"index": 0, "delta": {"role": "assistant", "content": word if i == 0 else " " + word}, "finish_reason": None}],
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    final = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+                    }
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        final["usage"] = usage
+                    self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                else:
+                    time.sleep(per_token * completion_tokens)
+                    self._send_json(200, {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": " ".join(words)},
+                            "finish_reason": finish_reason,
+                        }],
+                        "usage": usage,
+                    })
+                server._record(model, prompt_tokens, completion_tokens)
+
+            def _embeddings(self, body):
+                model = body.get("model") or "mock-embedding"
+                profile = server.profile_for(model)
+                if self._maybe_fail(model, profile):
+                    return
+                inputs = body.get("input", [])
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                time.sleep(profile.ttft())
+                data = []
+                prompt_tokens = 0
+                for i, text in enumerate(inputs):
+                    text = text if isinstance(text, str) else json.dumps(text)
+                    prompt_tokens += _count_tokens(text)
+                    # Deterministic vectors so nearest-neighbour lookups are repeatable across runs
+                    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+                    data.append({"object": "embedding", "index": i, "embedding": [rng.uniform(-1, 1) for _ in range(server.embedding_dim)]})
+                self._send_json(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": model,
+                    "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+                })
+                server._record(model, prompt_tokens, 0)
+
+        return Handler
+
+
+def build_arg_parser(add_help=True):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock server for AIMedNow benchmarks", add_help=add_help)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", default="lognormal:0.3:0.4", help="Time-to-first-token distribution, e.g. fixed:0.2, uniform:0.1:0.5, normal:0.3:0.1, lognormal:0.3:0.4")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0, help="Completion token rate, 0 for instant")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="Length of free-text answers before max_tokens capping")
+    parser.add_argument("--completion-per-prompt-token", type=float, default=0.0, help="Extra answer tokens per prompt token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an injected error")
+    parser.add_argument("--error-codes", default="429,500,503", help="Comma-separated HTTP codes used for injected errors")
+    parser.add_argument("--model-profiles", help="JSON file mapping model name -> profile fields (ttft, tokens_per_sec, ...)")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--seed", type=int)
+    return parser
+
+
+def server_from_args(args):
+    """Build a MockOpenAIServer from parsed command-line arguments."""
+    default_profile = ModelProfile(
+        ttft=args.ttft,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        completion_per_prompt_token=args.completion_per_prompt_token,
+        error_rate=args.error_rate,
+        error_codes=tuple(int(code) for code in args.error_codes.split(",") if code),
+    )
+    model_profiles = {}
+    if args.model_profiles:
+        with open(args.model_profiles) as f:
+            model_profiles = {name: ModelProfile.from_dict(data) for name, data in json.load(f).items()}
+    return MockOpenAIServer(
+        host=args.host,
+        port=args.port,
+        default_profile=default_profile,
+        model_profiles=model_profiles,
+        embedding_dim=args.embedding_dim,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    server = server_from_args(build_arg_parser().parse_args())
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
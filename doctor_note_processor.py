@@ -1,10 +1,114 @@
 import base64
-from openai import OpenAI
 import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from llm_client import get_client
+from metrics import span
+from model_tiering import simplification_tier
+from scheduler import llm_scheduler, SIMPLIFY, estimate_tokens
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("GRAPHRAG_API_KEY"))
+
+# OCR and section simplification calls run this many at a time for one document
+DOCUMENT_MAX_WORKERS = int(os.getenv("DOCUMENT_MAX_WORKERS", "4"))
+# Paragraphs are packed into sections of up to this many words, each simplified separately
+SECTION_MAX_WORDS = 350
+# Completion cap of the final summary pass over the simplified sections
+SUMMARY_MAX_TOKENS = 500
+# Follow-up requests allowed when a completion is cut off by max_tokens
+MAX_CONTINUATIONS = 4
+CONTINUE_PROMPT = "Continue exactly where you stopped. Do not repeat anything you already wrote."
+
+SIMPLIFIER_SYSTEM_PROMPT = "You are a medical translator who makes complex medical information accessible to the general public."
+
+def complete(stage, model, messages, max_tokens, temperature, image_tokens=0):
+    """
+    Run a chat completion through the scheduler, asking the model to continue
+    while its output is cut off by max_tokens, so long outputs are never truncated.
+    
+    Args:
+        stage (str): Span name for metrics, e.g. "note.ocr"
+        model (str): Model name
+        messages (list): Chat messages
+        max_tokens (int): Completion cap of each request
+        temperature (float): Sampling temperature
+        image_tokens (int): Prompt tokens taken by images, for the TPM estimate
+        
+    Returns:
+        str: The full completion text
+    """
+    prompt_text = "".join(m["content"] for m in messages if isinstance(m["content"], str))
+    prompt_text += "".join(
+        item.get("text", "") for m in messages if isinstance(m["content"], list) for item in m["content"]
+    )
+    parts = []
+    for _ in range(MAX_CONTINUATIONS + 1):
+        with llm_scheduler.slot(SIMPLIFY, estimate_tokens(prompt_text, image_tokens + max_tokens)), \
+                span(stage, model=model) as s:
+            response = get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            s.record_usage(response)
+        choice = response.choices[0]
+        content = choice.message.content or ""
+        parts.append(content)
+        if choice.finish_reason != "length":
+            break
+        messages = messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUE_PROMPT}
+        ]
+        prompt_text += content + CONTINUE_PROMPT
+    else:
+        print(f"Warning: {stage} output still cut off after {MAX_CONTINUATIONS} continuations")
+    return "".join(parts)
+
+def run_parallel(func, items, results=None, on_result=None):
+    """
+    Call func(item) for each item on a thread pool of up to DOCUMENT_MAX_WORKERS threads.
+    
+    Items whose entry in `results` is already set (from an earlier attempt) are skipped.
+    If a call fails, calls that have not started are cancelled, the running ones are still
+    collected, and the first error is raised once they finish, so completed work is not
+    lost. Worker threads inherit the caller's context (e.g. scheduler.background_calls()).
+    
+    Args:
+        func (callable): Function applied to each item
+        items (list): Inputs
+        results (list, optional): Known results, None for items still to run
+        on_result (callable, optional): Called as on_result(results) after each call finishes
+        
+    Returns:
+        list: func(item) for each item, in order
+    """
+    results = list(results) if results and len(results) == len(items) else [None] * len(items)
+    todo = [i for i, result in enumerate(results) if result is None]
+    if not todo:
+        return results
+    
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, min(DOCUMENT_MAX_WORKERS, len(todo)))) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, func, items[i]): i for i in todo}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                if error is None:
+                    error = e
+                    for pending in futures:
+                        pending.cancel()
+                continue
+            if on_result:
+                on_result(results)
+    if error is not None:
+        raise error
+    return results
 
 def is_doctor_note(image_description):
     """
@@ -26,15 +130,19 @@ def is_doctor_note(image_description):
     Answer only with "YES" if it's a doctor's note or medical document, or "NO" if it's not.
     """
     
-    response = client.chat.completions.create(
-        model=os.getenv("MODEL_NAME", "gpt-4"),
-        messages=[
-            {"role": "system", "content": "You are an AI that identifies medical documentation."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0,
-        max_tokens=10
-    )
+    model = os.getenv("MODEL_NAME", "gpt-4")
+    with llm_scheduler.slot(SIMPLIFY, estimate_tokens(prompt, 10)), \
+            span("note.is_doctor_note", model=model) as s:
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are an AI that identifies medical documentation."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            max_tokens=10
+        )
+        s.record_usage(response)
     
     answer = response.choices[0].message.content.strip().upper()
     return answer == "YES"
@@ -56,9 +164,12 @@ def ocr_doctor_note(base64_image):
     Try to maintain the original layout structure when possible.
     """
     
-    response = client.chat.completions.create(
-        model=os.getenv("MODEL_NAME", "gpt-4"),
-        messages=[
+    model = os.getenv("MODEL_NAME", "gpt-4")
+    # Images cost roughly 1K prompt tokens on top of the text
+    return complete(
+        "note.ocr",
+        model,
+        [
             {
                 "role": "system",
                 "content": "You are an OCR system specialized in medical documentation. Extract all text faithfully."
@@ -71,11 +182,69 @@ def ocr_doctor_note(base64_image):
                 ],
             },
         ],
+        max_tokens=1500,
         temperature=0.1,
-        max_tokens=1500
+        image_tokens=1000
     )
+
+def ocr_pages(pages, page_texts=None, on_page=None):
+    """
+    Read every page of a document, OCR'ing the page images in parallel so the
+    total time follows the slowest page rather than the page count.
+    
+    Args:
+        pages (list): Page dicts from document_pages.load_pages; pages with "text"
+            already set (PDF text layer) are not OCR'd
+        page_texts (list, optional): Page texts from an earlier attempt, None for pages
+            still to read
+        on_page (callable, optional): Called as on_page(page_texts) each time a page
+            finishes, with None for pages still being read
+        
+    Returns:
+        list: Text of each page, in page order
+    """
+    def read(page):
+        if page.get("text") is not None:
+            return page["text"]
+        return ocr_doctor_note(page["image"])
+    
+    return run_parallel(read, pages, page_texts, on_page)
+
+def split_sections(page_texts, max_words=SECTION_MAX_WORDS):
+    """
+    Split a document into sections of whole paragraphs of at most `max_words`
+    words each. Longer paragraphs are split by line, and longer lines by word count.
+    
+    Args:
+        page_texts (list): Text of each page
+        max_words (int): Target section length
+        
+    Returns:
+        list: Section texts, in document order
+    """
+    pieces = []
+    for text in page_texts:
+        for paragraph in (text or "").split("\n\n"):
+            if len(paragraph.split()) <= max_words:
+                if paragraph.strip():
+                    pieces.append(paragraph.strip())
+                continue
+            for line in paragraph.split("\n"):
+                words = line.split()
+                for start in range(0, len(words), max_words):
+                    pieces.append(" ".join(words[start:start + max_words]))
     
-    return response.choices[0].message.content
+    sections, current, words = [], [], 0
+    for piece in pieces:
+        piece_words = len(piece.split())
+        if current and words + piece_words > max_words:
+            sections.append("\n\n".join(current))
+            current, words = [], 0
+        current.append(piece)
+        words += piece_words
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
 
 def simplify_medical_text(medical_text):
     """
@@ -102,51 +271,187 @@ def simplify_medical_text(medical_text):
     {medical_text}
     """
     
-    response = client.chat.completions.create(
-        model=os.getenv("MODEL_NAME", "gpt-4"),
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a medical translator who makes complex medical information accessible to the general public."
-            },
+    # Short, plain notes go to the small model; long or jargon-heavy ones to MODEL_NAME
+    tier = simplification_tier(medical_text)
+    simplified = complete(
+        "note.simplify",
+        tier.model,
+        [
+            {"role": "system", "content": tier.with_length_budget(SIMPLIFIER_SYSTEM_PROMPT)},
             {"role": "user", "content": prompt}
         ],
-        temperature=0.7,
-        max_tokens=2000
+        max_tokens=tier.max_tokens,
+        temperature=0.7
     )
     
     return {
         "original": medical_text,
-        "simplified": response.choices[0].message.content
+        "simplified": simplified
     }
 
-def process_doctor_note(base64_image, initial_description):
+def simplify_section(section_text, index, total):
     """
-    Process a doctor's note image: check if it's a doctor's note,
-    perform OCR, and simplify the content.
+    Simplify one section of a long document. Same rewrite rules as
+    simplify_medical_text, without the closing summary.
     
     Args:
-        base64_image (str): Base64 encoded image
+        section_text (str): The section's original text
+        index (int): 1-based position of the section
+        total (int): Number of sections in the document
+        
+    Returns:
+        str: The simplified section
+    """
+    prompt = f"""
+    Below is part {index} of {total} of the text extracted from a doctor's note or medical document. Please:
+    
+    1. Rewrite this part at a 7th-grade reading level (age 12-13) while preserving all important medical information
+    2. For each medical jargon term, add a brief, simple definition in [brackets]
+    3. Convert any treatment instructions into clear, step-by-step directions 
+    4. Use the headings Diagnosis, Medications, Instructions and Follow-up for the information in this part that fits them
+    5. If there are medications, clearly explain: what each is for, how to take it, and potential side effects to watch for
+    
+    Only cover this part; do not add an introduction or a summary.
+    
+    Original text:
+    {section_text}
+    """
+    
+    tier = simplification_tier(section_text)
+    return complete(
+        "note.simplify_section",
+        tier.model,
+        [
+            {"role": "system", "content": tier.with_length_budget(SIMPLIFIER_SYSTEM_PROMPT)},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=tier.max_tokens,
+        temperature=0.7
+    )
+
+def summarize_sections(simplified_sections, medical_text):
+    """
+    Final pass over a simplified multi-section document: write the closing summary paragraph.
+    
+    Args:
+        simplified_sections (list): The simplified sections, in order
+        medical_text (str): The full original text, used to pick the model
+        
+    Returns:
+        str: The summary paragraph
+    """
+    simplified_text = "\n\n".join(simplified_sections)
+    prompt = f"""
+    Below is a patient-friendly version of a doctor's note or medical document, simplified part by part.
+    Write one paragraph summarizing what the report says in an 8th-grade level and patient-friendly manner.
+    Mention the diagnosis, the most important medications or instructions, and when to follow up.
+    
+    Simplified text:
+    {simplified_text}
+    """
+    
+    tier = simplification_tier(medical_text)
+    return complete(
+        "note.summarize",
+        tier.model,
+        [
+            {"role": "system", "content": SIMPLIFIER_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+        temperature=0.7
+    )
+
+def simplify_document(sections, medical_text, simplified_sections=None, on_section=None):
+    """
+    Simplify a long document section by section in parallel, then add a summary.
+    
+    Args:
+        sections (list): Section texts from split_sections
+        medical_text (str): The full original text
+        simplified_sections (list, optional): Simplified sections from an earlier attempt,
+            None for sections still to simplify
+        on_section (callable, optional): Called as on_section(simplified_sections) each
+            time a section finishes, with None for sections still running
+        
+    Returns:
+        str: The simplified sections followed by the summary paragraph
+    """
+    numbered = [(i + 1, section) for i, section in enumerate(sections)]
+    simplified = run_parallel(
+        lambda item: simplify_section(item[1], item[0], len(sections)),
+        numbered,
+        simplified_sections,
+        on_section
+    )
+    
+    summary = summarize_sections(simplified, medical_text)
+    return "\n\n".join(simplified + ["## Summary", summary])
+
+def process_doctor_note(document, initial_description, on_progress=None, previous=None):
+    """
+    Process a doctor's note: check if it's a doctor's note, OCR every page,
+    and simplify the content. Long documents are simplified in sections.
+    
+    Args:
+        document (str or list): Base64 encoded image, or the page dicts of a
+            multi-page upload from document_pages.load_pages
         initial_description (str): Initial description from the VLM
+        on_progress (callable, optional): Called as on_progress(stage, **partial_results)
+            when each stage starts, so callers can show partial results early
+        previous (dict, optional): Partial results reported by an earlier attempt;
+            stages, pages and sections that already finished are not redone
         
     Returns:
         dict: Processing results including simplified content and original
     """
+    report = on_progress or (lambda stage, **partial: None)
+    previous = previous or {}
+    pages = [{"number": 1, "image": document, "text": None}] if isinstance(document, str) else document
+    
     # Check if it's a doctor's note
-    if not is_doctor_note(initial_description):
-        return {
-            "is_doctor_note": False,
-            "message": "This doesn't appear to be a doctor's note or medical document."
-        }
+    if not previous.get("is_doctor_note"):
+        report("checking")
+        if not is_doctor_note(initial_description):
+            return {
+                "is_doctor_note": False,
+                "message": "This doesn't appear to be a doctor's note or medical document."
+            }
     
-    # Perform OCR on the image
-    extracted_text = ocr_doctor_note(base64_image)
+    # Perform OCR on every page in parallel, recording each page as it finishes
+    def on_page(texts):
+        report("ocr", page_texts=texts, pages_done=sum(text is not None for text in texts))
     
-    # Simplify the medical text
-    processed_content = simplify_medical_text(extracted_text)
+    page_texts = previous.get("page_texts")
+    report("ocr", is_doctor_note=True, pages_total=len(pages),
+           pages_done=sum(text is not None for text in page_texts or []))
+    page_texts = ocr_pages(pages, page_texts, on_page=on_page)
+    if len(pages) == 1:
+        extracted_text = page_texts[0]
+    else:
+        extracted_text = "\n\n".join(
+            f"--- Page {page['number']} ---\n{text}" for page, text in zip(pages, page_texts)
+        )
+    
+    # Simplify the medical text, in parallel sections if it is long
+    sections = split_sections(page_texts)
+    simplified_sections = previous.get("simplified_sections")
+    if not simplified_sections or len(simplified_sections) != len(sections):
+        simplified_sections = None
+    report("simplifying", original_text=extracted_text, sections_total=len(sections),
+           sections_done=sum(section is not None for section in simplified_sections or []))
+    if len(sections) <= 1:
+        simplified_text = simplify_medical_text(extracted_text)["simplified"]
+    else:
+        def on_section(simplified):
+            done = sum(section is not None for section in simplified)
+            report("simplifying" if done < len(sections) else "summarizing",
+                   simplified_sections=simplified, sections_done=done)
+        
+        simplified_text = simplify_document(sections, extracted_text, simplified_sections, on_section=on_section)
     
     return {
         "is_doctor_note": True,
-        "original_text": processed_content["original"],
-        "simplified_text": processed_content["simplified"]
+        "original_text": extracted_text,
+        "simplified_text": simplified_text
     }
\ No newline at end of file
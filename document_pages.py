@@ -0,0 +1,151 @@
+import base64
+import os
+
+from metrics import span
+
+# PDF pages with at least this much embedded text skip OCR and use the text layer
+MIN_TEXT_LAYER_CHARS = 50
+# Resolution used to rasterize scanned PDF pages for OCR
+PDF_RASTER_DPI = 150
+# Uploads with more pages are rejected so one upload can't monopolize the OCR workers
+MAX_PAGES = int(os.getenv("MAX_DOCUMENT_PAGES", "30"))
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+DOCUMENT_EXTENSIONS = IMAGE_EXTENSIONS | {'pdf'}
+
+
+def encode_image(image_path):
+    # from https://community.openai.com/t/how-to-load-a-local-image-to-gpt4-vision-using-api/533090/3
+    with span("image.encode"):
+        with open(image_path, "rb") as image_file:
+            return base64.b64encode(image_file.read()).decode('utf-8')
+
+
+def _extension(path):
+    return path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+
+
+def _pdf_text_layer(path):
+    """Embedded text of each PDF page, or None if pypdf is not installed."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        print("Warning: pypdf not installed, PDF text layers are ignored and every page is OCR'd.")
+        print("Install with: pip install pypdf")
+        return None
+    reader = PdfReader(path)
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def _pdf_page_images(path, page_numbers):
+    """PNG renderings (base64) of the given 0-based PDF pages, or None if PyMuPDF is not installed."""
+    try:
+        import fitz
+    except ImportError:
+        print("Warning: PyMuPDF not installed, scanned PDF pages can't be read.")
+        print("Install with: pip install pymupdf")
+        return None
+    images = {}
+    with fitz.open(path) as document:
+        for number in page_numbers:
+            pixmap = document[number].get_pixmap(dpi=PDF_RASTER_DPI)
+            images[number] = base64.b64encode(pixmap.tobytes("png")).decode('utf-8')
+    return images
+
+
+def _pdf_page_count(path):
+    """Number of pages of a PDF, read from its page tree without rendering; 0 if neither pypdf nor PyMuPDF is installed."""
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(path).pages)
+    except ImportError:
+        pass
+    try:
+        import fitz
+    except ImportError:
+        return 0
+    with fitz.open(path) as document:
+        return document.page_count
+
+
+def count_pages(filepaths):
+    """
+    Count the pages of an upload without decoding images or rasterizing PDFs.
+
+    Args:
+        filepaths (list): Paths of the uploaded images and PDFs
+
+    Returns:
+        int: One per image plus the pages of each PDF. A PDF that can't be counted
+            (no PDF library installed) counts as one page; load_pages reports the error.
+    """
+    return sum(max(1, _pdf_page_count(path)) if _extension(path) == 'pdf' else 1 for path in filepaths)
+
+
+def pdf_pages(path):
+    """
+    Split a PDF into pages. Pages with a text layer keep their text; the rest are
+    rasterized for OCR.
+
+    Args:
+        path (str): Path of the PDF file
+
+    Returns:
+        list: Page dicts with either "text" or "image" (base64 PNG) set
+
+    Raises:
+        ValueError: If the PDF has pages without text and PyMuPDF is not installed
+    """
+    texts = _pdf_text_layer(path)
+    if texts is None:
+        texts = [""] * _pdf_page_count(path)
+        if not texts:
+            raise ValueError("Reading PDFs requires pypdf or PyMuPDF (pip install pypdf pymupdf).")
+    scanned = [i for i, text in enumerate(texts) if len(text.strip()) < MIN_TEXT_LAYER_CHARS]
+    images = _pdf_page_images(path, scanned) if scanned else {}
+    if images is None:
+        raise ValueError("This PDF has scanned pages; install PyMuPDF (pip install pymupdf) to read them.")
+
+    pages = []
+    for i, text in enumerate(texts):
+        if i in images:
+            pages.append({"image": images[i], "text": None})
+        else:
+            pages.append({"image": None, "text": text.strip()})
+    return pages
+
+
+def too_many_pages_message(page_count):
+    return f"This document has {page_count} pages; at most {MAX_PAGES} pages can be processed at once."
+
+
+def load_pages(filepaths):
+    """
+    Turn uploaded files into an ordered list of pages: one per image, one per PDF page.
+
+    Args:
+        filepaths (list): Paths of the uploaded images and PDFs, in upload order
+
+    Returns:
+        list: Page dicts {"number", "source", "image", "text"}; "image" is base64 for pages
+            that need OCR, "text" is set for PDF pages with a text layer
+
+    Raises:
+        ValueError: If the upload has more than MAX_PAGES pages (checked before any page is read)
+    """
+    page_count = count_pages(filepaths)
+    if page_count > MAX_PAGES:
+        raise ValueError(too_many_pages_message(page_count))
+    pages = []
+    for path in filepaths:
+        if _extension(path) == 'pdf':
+            with span("document.split_pdf"):
+                file_pages = pdf_pages(path)
+        else:
+            file_pages = [{"image": encode_image(path), "text": None}]
+        for page in file_pages:
+            page["source"] = os.path.basename(path)
+            pages.append(page)
+    for number, page in enumerate(pages, start=1):
+        page["number"] = number
+    return pages
@@ -1,71 +1,93 @@
 import os
 import json
 import asyncio
-from openai import OpenAI
+import threading
 from dotenv import load_dotenv
-from grag.graphrag_search import GraphRAGSearchEngine
+from llm_client import get_client
+from metrics import span
+from model_tiering import general_answer_tier
+from scheduler import llm_scheduler, Overloaded, EMERGENCY, GENERAL, estimate_tokens
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("GRAPHRAG_API_KEY"))
 
 class EmergencyResponseSystem:
     """System to classify and route questions to either GraphRAG (for emergencies) 
     or general LLM responses."""
     
     def __init__(self):
-        self.client = client
         # Initialize GraphRAG engine lazily when needed
         self._engine = None
+        self._engine_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        return get_client()
     
     @property
     def engine(self):
         """Lazy initialization of GraphRAG engine"""
         if self._engine is None:
-            # Use absolute path for input_dir
-            input_dir = os.path.expanduser("~/AIMed/AIMedNow/grag/docs/output-us-emt")
-            # print(f"Initializing GraphRAG engine with input_dir: {input_dir}")
-            print(f"Answering with grounded EMT data at {input_dir} (GraphRAG search engine)")
-            
-            self._engine = GraphRAGSearchEngine(
-                input_dir=input_dir,
-                community_level=2,
-                api_key=os.getenv("GRAPHRAG_API_KEY"),
-                llm_model=os.getenv("GRAPHRAG_LLM_MODEL", "gpt-4"),
-                embedding_model=os.getenv("GRAPHRAG_EMBEDDING_MODEL", "text-embedding-ada-002"),
-                use_covariates=False
-            )
-            
-            # Update search parameters
-            self._engine.update_search_params(
-                context_params={
-                    "text_unit_prop": 0.6,
-                    "max_tokens": 10_000,
-                },
-                model_params={
-                    "temperature": 0.1,
-                },
-                response_type="detailed explanation"
-            )
+            with self._engine_lock:
+                if self._engine is None:
+                    self._engine = self._create_engine()
         return self._engine
     
+    def _create_engine(self):
+        """Build the GraphRAG engine. graphrag, pandas and tiktoken are only imported here."""
+        from grag.graphrag_search import GraphRAGSearchEngine
+        
+        # Use absolute path for input_dir (GRAPHRAG_INPUT_DIR overrides it, e.g. for benchmarks)
+        input_dir = os.path.expanduser(
+            os.getenv("GRAPHRAG_INPUT_DIR", "~/AIMed/AIMedNow/grag/docs/output-us-emt")
+        )
+        # print(f"Initializing GraphRAG engine with input_dir: {input_dir}")
+        print(f"Answering with grounded EMT data at {input_dir} (GraphRAG search engine)")
+        
+        engine = GraphRAGSearchEngine(
+            input_dir=input_dir,
+            community_level=2,
+            api_key=os.getenv("GRAPHRAG_API_KEY"),
+            llm_model=os.getenv("GRAPHRAG_LLM_MODEL", "gpt-4"),
+            embedding_model=os.getenv("GRAPHRAG_EMBEDDING_MODEL", "text-embedding-ada-002"),
+            use_covariates=False,
+            span_factory=span
+        )
+        
+        # Update search parameters
+        engine.update_search_params(
+            context_params={
+                "text_unit_prop": 0.6,
+                "max_tokens": 10_000,
+            },
+            model_params={
+                "temperature": 0.1,
+            },
+            response_type="detailed explanation"
+        )
+        return engine
+    
     async def classify_emergency(self, question):
         """Classify if a question is emergency-related."""
         try:
-            response = client.chat.completions.create(
-                model=os.getenv("MODEL_NAME", "gpt-4"),
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a medical triage assistant. Your task is to classify whether a question is related to a medical emergency that requires immediate or urgent care. Only classify as emergency questions about injuries, severe symptoms, or situations requiring first aid or emergency treatment. Respond with ONLY one word: 'emergency' or 'non-emergency'."
-                    },
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.0,
-                max_tokens=20
-            )
+            model = os.getenv("MODEL_NAME", "gpt-4")
+            # Triage runs at emergency priority since it decides whether the question is one
+            with llm_scheduler.slot(EMERGENCY, estimate_tokens(question, 20)), \
+                    span("classify_emergency", model=model) as s:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are a medical triage assistant. Your task is to classify whether a question is related to a medical emergency that requires immediate or urgent care. Only classify as emergency questions about injuries, severe symptoms, or situations requiring first aid or emergency treatment. Respond with ONLY one word: 'emergency' or 'non-emergency'."
+                        },
+                        {"role": "user", "content": question}
+                    ],
+                    temperature=0.0,
+                    max_tokens=20
+                )
+                s.record_usage(response)
             # print(response)
             classification = response.choices[0].message.content.strip().lower()
             
@@ -75,6 +97,8 @@ class EmergencyResponseSystem:
             else:
                 return "emergency"
                 
+        except Overloaded:
+            raise
         except Exception as e:
             print(f"Error classifying emergency: {e}")
             # Default to non-emergency in case of errors
@@ -84,12 +108,17 @@ class EmergencyResponseSystem:
         """Get response from GraphRAG for emergency questions."""
         try:
             # Use GraphRAG for emergency responses
-            search_result = await self.engine.search(question)
+            context_tokens = self.engine.search_engine.context_builder_params.get("max_tokens", 12_000)
+            response_tokens = self.engine.search_engine.model_params.get("max_tokens", 2_000)
+            with llm_scheduler.slot(EMERGENCY, context_tokens + response_tokens):
+                search_result = await self.engine.search(question)
             return {
                 'answer': search_result.response,
                 'source': search_result.context_text,
                 'classification': 'emergency'
             }
+        except Overloaded:
+            raise
         except Exception as e:
             print(f"Error getting emergency response: {e}")
             # Fallback to general response if GraphRAG fails
@@ -98,23 +127,36 @@ class EmergencyResponseSystem:
     async def get_general_response(self, question, is_fallback=False):
         """Get response from general LLM for non-emergency questions."""
         try:
-            response = client.chat.completions.create(
-                model=os.getenv("MODEL_NAME", "gpt-4"),
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful assistant answering general health questions." + 
-                                  (" NOTE: This is a fallback response because the emergency system failed. Add appropriate caution." if is_fallback else "")
-                    },
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.7
-            )
+            classification = 'emergency-fallback' if is_fallback else 'non-emergency'
+            # Simple questions go to the small model; fallbacks and complex questions to MODEL_NAME
+            tier = general_answer_tier(question, classification)
+            # A fallback is still answering an emergency, so it keeps emergency priority
+            priority = EMERGENCY if is_fallback else GENERAL
+            with llm_scheduler.slot(priority, estimate_tokens(question, tier.max_tokens or 1000)), \
+                    span("general_response", model=tier.model) as s:
+                response = self.client.chat.completions.create(
+                    model=tier.model,
+                    messages=[
+                        {
+                            "role": "system", 
+                            "content": tier.with_length_budget(
+                                "You are a helpful assistant answering general health questions." +
+                                (" NOTE: This is a fallback response because the emergency system failed. Add appropriate caution." if is_fallback else "")
+                            )
+                        },
+                        {"role": "user", "content": question}
+                    ],
+                    temperature=0.7,
+                    max_tokens=tier.max_tokens
+                )
+                s.record_usage(response)
             return {
                 'answer': response.choices[0].message.content,
                 'source': 'general_llm',
-                'classification': 'non-emergency' if not is_fallback else 'emergency-fallback'
+                'classification': classification
             }
+        except Overloaded:
+            raise
         except Exception as e:
             print(f"Error getting general response: {e}")
             return {
@@ -137,6 +179,12 @@ class EmergencyResponseSystem:
 # Create a singleton instance
 emergency_system = EmergencyResponseSystem()
 
+def warm_up_engine():
+    """Build the GraphRAG engine in a background thread so the first emergency question doesn't pay for it."""
+    thread = threading.Thread(target=lambda: emergency_system.engine, name="graphrag-warmup", daemon=True)
+    thread.start()
+    return thread
+
 # Function to handle async operation in sync context
 def process_question_sync(question):
     """Synchronous wrapper for processing questions."""
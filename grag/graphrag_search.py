@@ -1,16 +1,13 @@
 import os
-import pandas as pd
+import uuid
+import pickle
+import hashlib
+import contextvars
+from contextlib import contextmanager
 import tiktoken
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, Optional, Union, Callable
 
 from graphrag.query.context_builder.entity_extraction import EntityVectorStoreKey
-from graphrag.query.indexer_adapters import (
-    read_indexer_covariates,
-    read_indexer_entities,
-    read_indexer_relationships,
-    read_indexer_reports,
-    read_indexer_text_units,
-)
 from graphrag.query.structured_search.local_search.mixed_context import (
     LocalSearchMixedContext,
 )
@@ -24,6 +21,34 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Table names
+COMMUNITY_REPORT_TABLE = "community_reports"
+ENTITY_TABLE = "entities"
+COMMUNITY_TABLE = "communities"
+RELATIONSHIP_TABLE = "relationships"
+COVARIATE_TABLE = "covariates"
+TEXT_UNIT_TABLE = "text_units"
+
+# Bump when the snapshot layout or the objects stored in it change
+SNAPSHOT_VERSION = 1
+
+# Per-search scratch space used to hand the generation span from build_context back to search()
+_search_phases = contextvars.ContextVar("graphrag_search_phases", default=None)
+
+
+class _NullSpan:
+    def record_usage(self, *args, **kwargs):
+        pass
+
+    def add_tokens(self, *args, **kwargs):
+        pass
+
+
+@contextmanager
+def _null_span(stage, model=None):
+    yield _NullSpan()
+
+
 class GraphRAGSearchEngine:
     """
     A wrapper library for the GraphRAG search engine that simplifies the setup and query process.
@@ -38,6 +63,10 @@ class GraphRAGSearchEngine:
         llm_model: Optional[str] = None,
         embedding_model: Optional[str] = None,
         use_covariates: bool = False,
+        api_base: Optional[str] = None,
+        span_factory: Optional[Callable] = None,
+        snapshot_path: Optional[str] = None,
+        use_snapshot: Optional[bool] = None,
     ):
         """
         Initialize the GraphRAG search engine.
@@ -50,6 +79,14 @@ class GraphRAGSearchEngine:
             llm_model: LLM model to use (defaults to GRAPHRAG_LLM_MODEL env var)
             embedding_model: Embedding model to use (defaults to GRAPHRAG_EMBEDDING_MODEL env var)
             use_covariates: Whether to use covariates (if available)
+            api_base: Base URL of an OpenAI-compatible API (defaults to GRAPHRAG_API_BASE env var,
+                then the OpenAI endpoint)
+            span_factory: Context manager factory called as span_factory(stage, model=None) to time
+                the setup, context building, LanceDB lookup and generation phases (e.g. metrics.span)
+            snapshot_path: Path of the precompiled index snapshot (defaults to GRAPHRAG_SNAPSHOT_PATH
+                env var, then {input_dir}/index_snapshot.pkl)
+            use_snapshot: Load the index from the snapshot when it is current, and write it after
+                reading the parquet files otherwise (defaults to GRAPHRAG_USE_SNAPSHOT env var, on)
         """
         self.input_dir = input_dir
         self.lancedb_uri = lancedb_uri or f"{input_dir}/lancedb"
@@ -58,17 +95,24 @@ class GraphRAGSearchEngine:
         self.llm_model = llm_model or os.environ.get("GRAPHRAG_LLM_MODEL")
         self.embedding_model = embedding_model or os.environ.get("GRAPHRAG_EMBEDDING_MODEL")
         self.use_covariates = use_covariates
+        self.api_base = api_base or os.environ.get("GRAPHRAG_API_BASE")
+        self.span = span_factory or _null_span
+        self.snapshot_path = snapshot_path or os.environ.get("GRAPHRAG_SNAPSHOT_PATH") or f"{input_dir}/index_snapshot.pkl"
+        if use_snapshot is None:
+            use_snapshot = os.environ.get("GRAPHRAG_USE_SNAPSHOT", "1") != "0"
+        self.use_snapshot = use_snapshot
         
         # Table names
-        self.COMMUNITY_REPORT_TABLE = "community_reports"
-        self.ENTITY_TABLE = "entities"
-        self.COMMUNITY_TABLE = "communities"
-        self.RELATIONSHIP_TABLE = "relationships"
-        self.COVARIATE_TABLE = "covariates"
-        self.TEXT_UNIT_TABLE = "text_units"
+        self.COMMUNITY_REPORT_TABLE = COMMUNITY_REPORT_TABLE
+        self.ENTITY_TABLE = ENTITY_TABLE
+        self.COMMUNITY_TABLE = COMMUNITY_TABLE
+        self.RELATIONSHIP_TABLE = RELATIONSHIP_TABLE
+        self.COVARIATE_TABLE = COVARIATE_TABLE
+        self.TEXT_UNIT_TABLE = TEXT_UNIT_TABLE
         
         # Initialize the search engine
-        self.search_engine = self._setup_search_engine()
+        with self.span("graphrag.setup"):
+            self.search_engine = self._setup_search_engine()
     
     def _setup_search_engine(self) -> LocalSearch:
         """
@@ -77,40 +121,34 @@ class GraphRAGSearchEngine:
         Returns:
             LocalSearch: The configured search engine
         """
-        # Load entity and community data
-        entity_df = pd.read_parquet(f"{self.input_dir}/{self.ENTITY_TABLE}.parquet")
-        community_df = pd.read_parquet(f"{self.input_dir}/{self.COMMUNITY_TABLE}.parquet")
-        entities = read_indexer_entities(entity_df, community_df, self.community_level)
+        # Load entities, relationships, covariates, reports and text units
+        index = self._load_index()
+        entities = index["entities"]
+        relationships = index["relationships"]
+        covariates = index["covariates"]
+        reports = index["reports"]
+        text_units = index["text_units"]
         
         # Set up entity embedding store
         description_embedding_store = LanceDBVectorStore(
             collection_name="default-entity-description",
         )
         description_embedding_store.connect(db_uri=self.lancedb_uri)
-        
-        # Load relationships
-        relationship_df = pd.read_parquet(f"{self.input_dir}/{self.RELATIONSHIP_TABLE}.parquet")
-        relationships = read_indexer_relationships(relationship_df)
-        
-        # Load covariates if needed
-        covariates = None
-        if self.use_covariates:
-            covariate_df = pd.read_parquet(f"{self.input_dir}/{self.COVARIATE_TABLE}.parquet")
-            claims = read_indexer_covariates(covariate_df)
-            covariates = {"claims": claims}
-        
-        # Load reports and text units
-        report_df = pd.read_parquet(f"{self.input_dir}/{self.COMMUNITY_REPORT_TABLE}.parquet")
-        reports = read_indexer_reports(report_df, community_df, self.community_level)
-        
-        text_unit_df = pd.read_parquet(f"{self.input_dir}/{self.TEXT_UNIT_TABLE}.parquet")
-        text_units = read_indexer_text_units(text_unit_df)
+        token_encoder = tiktoken.encoding_for_model(self.llm_model)
+        try:
+            embedding_encoder = tiktoken.encoding_for_model(self.embedding_model)
+        except KeyError:
+            embedding_encoder = token_encoder
+        description_embedding_store.similarity_search_by_text = self._trace_similarity_search(
+            description_embedding_store.similarity_search_by_text, embedding_encoder
+        )
         
         # Set up language model components
         chat_config = LanguageModelConfig(
             api_key=self.api_key,
             type=ModelType.OpenAIChat,
             model=self.llm_model,
+            api_base=self.api_base,
             max_retries=20,
         )
         chat_model = ModelManager().get_or_create_chat_model(
@@ -119,12 +157,11 @@ class GraphRAGSearchEngine:
             config=chat_config,
         )
         
-        token_encoder = tiktoken.encoding_for_model(self.llm_model)
-        
         embedding_config = LanguageModelConfig(
             api_key=self.api_key,
             type=ModelType.OpenAIEmbedding,
             model=self.embedding_model,
+            api_base=self.api_base,
             max_retries=20,
         )
         
@@ -146,6 +183,7 @@ class GraphRAGSearchEngine:
             text_embedder=text_embedder,
             token_encoder=token_encoder,
         )
+        context_builder.build_context = self._trace_build_context(context_builder.build_context)
         
         # Configure search parameters
         local_context_params = {
@@ -178,6 +216,30 @@ class GraphRAGSearchEngine:
             response_type="single paragraph",
         )
     
+    def _load_index(self) -> Dict[str, Any]:
+        """
+        Load the indexed objects, from the snapshot when it matches the parquet files.
+        
+        Returns:
+            Dict[str, Any]: entities, relationships, covariates, reports and text_units
+        """
+        if self.use_snapshot:
+            header = snapshot_header(self.input_dir, self.community_level, self.use_covariates)
+            with self.span("graphrag.snapshot_load"):
+                index = load_index_snapshot(self.snapshot_path, header)
+            if index is not None:
+                return index
+        
+        with self.span("graphrag.parquet_load"):
+            index = read_index_from_parquet(self.input_dir, self.community_level, self.use_covariates)
+        
+        if self.use_snapshot:
+            try:
+                save_index_snapshot(index, self.snapshot_path, header)
+            except OSError as e:
+                print(f"Could not write GraphRAG index snapshot to {self.snapshot_path}: {e}")
+        return index
+    
     async def search(self, query: str) -> str:
         """
         Search the GraphRAG knowledge base with the given query.
@@ -188,8 +250,59 @@ class GraphRAGSearchEngine:
         Returns:
             SearchResult: The response from the search engine
         """
-        result = await self.search_engine.search(query)
+        phases = {}
+        token = _search_phases.set(phases)
+        try:
+            with self.span("graphrag.search", model=self.llm_model):
+                try:
+                    result = await self.search_engine.search(query)
+                except BaseException as e:
+                    if "generation" in phases:
+                        phases["generation"].__exit__(type(e), e, e.__traceback__)
+                    raise
+                if "generation" in phases:
+                    # The answer is streamed, so there is no API usage field; graphrag counts the
+                    # tokens with tiktoken. Only the "response" category is the generation call.
+                    prompt_tokens = getattr(result, "prompt_tokens_categories", None) or {}
+                    output_tokens = getattr(result, "output_tokens_categories", None) or {}
+                    phases["generation_span"].add_tokens(
+                        prompt_tokens.get("response", getattr(result, "prompt_tokens", 0)),
+                        output_tokens.get("response", getattr(result, "output_tokens", 0)),
+                        estimated=True,
+                    )
+                    phases["generation"].__exit__(None, None, None)
+        finally:
+            _search_phases.reset(token)
         return result
+
+    def _trace_similarity_search(self, similarity_search_by_text: Callable, token_encoder) -> Callable:
+        """
+        Wrap the LanceDB entity lookup, including the query embedding call it makes, in the
+        graphrag.lancedb span. graphrag does not expose the embedding API's usage, so the
+        query's tokens are counted with tiktoken and recorded as an estimate.
+        """
+        def wrapper(*args, **kwargs):
+            text = kwargs.get("text", args[0] if args else "")
+            with self.span("graphrag.lancedb", model=self.embedding_model) as s:
+                s.add_tokens(prompt_tokens=len(token_encoder.encode(text or "")), estimated=True)
+                return similarity_search_by_text(*args, **kwargs)
+        return wrapper
+
+    def _trace_build_context(self, build_context: Callable) -> Callable:
+        """
+        Wrap the context builder so context building gets its own span, and open the
+        generation span as soon as the context is ready. search() closes it once the
+        LLM answer is back, so generation time excludes context building.
+        """
+        def wrapper(*args, **kwargs):
+            with self.span("graphrag.context"):
+                context = build_context(*args, **kwargs)
+            phases = _search_phases.get()
+            if phases is not None and "generation" not in phases:
+                phases["generation"] = self.span("graphrag.generation", model=self.llm_model)
+                phases["generation_span"] = phases["generation"].__enter__()
+            return context
+        return wrapper
     
     def update_search_params(
         self, 
@@ -215,6 +328,148 @@ class GraphRAGSearchEngine:
             self.search_engine.response_type = response_type
 
 
+def read_index_from_parquet(input_dir: str, community_level: int = 2, use_covariates: bool = False) -> Dict[str, Any]:
+    """
+    Read the parquet tables and convert them with the graphrag indexer adapters.
+    
+    Args:
+        input_dir: Directory containing the indexed data
+        community_level: Community level to use for entity and report selection
+        use_covariates: Whether to load covariates
+        
+    Returns:
+        Dict[str, Any]: entities, relationships, covariates, reports and text_units
+    """
+    # pandas and the adapters are only needed here, so a snapshot load skips importing them
+    import pandas as pd
+    from graphrag.query.indexer_adapters import (
+        read_indexer_covariates,
+        read_indexer_entities,
+        read_indexer_relationships,
+        read_indexer_reports,
+        read_indexer_text_units,
+    )
+    
+    # Load entity and community data
+    entity_df = pd.read_parquet(f"{input_dir}/{ENTITY_TABLE}.parquet")
+    community_df = pd.read_parquet(f"{input_dir}/{COMMUNITY_TABLE}.parquet")
+    entities = read_indexer_entities(entity_df, community_df, community_level)
+    
+    # Load relationships
+    relationship_df = pd.read_parquet(f"{input_dir}/{RELATIONSHIP_TABLE}.parquet")
+    relationships = read_indexer_relationships(relationship_df)
+    
+    # Load covariates if needed
+    covariates = None
+    if use_covariates:
+        covariate_df = pd.read_parquet(f"{input_dir}/{COVARIATE_TABLE}.parquet")
+        claims = read_indexer_covariates(covariate_df)
+        covariates = {"claims": claims}
+    
+    # Load reports and text units
+    report_df = pd.read_parquet(f"{input_dir}/{COMMUNITY_REPORT_TABLE}.parquet")
+    reports = read_indexer_reports(report_df, community_df, community_level)
+    
+    text_unit_df = pd.read_parquet(f"{input_dir}/{TEXT_UNIT_TABLE}.parquet")
+    text_units = read_indexer_text_units(text_unit_df)
+    
+    return {
+        "entities": entities,
+        "relationships": relationships,
+        "covariates": covariates,
+        "reports": reports,
+        "text_units": text_units,
+    }
+
+
+def snapshot_header(input_dir: str, community_level: int = 2, use_covariates: bool = False) -> Dict[str, Any]:
+    """
+    Describe what a snapshot is built from. A snapshot is only used if its header matches
+    exactly, so changed parquet files, settings or graphrag versions force a rebuild.
+    
+    Args:
+        input_dir: Directory containing the indexed data
+        community_level: Community level used for entity and report selection
+        use_covariates: Whether covariates are loaded
+        
+    Returns:
+        Dict[str, Any]: Snapshot version, graphrag version, settings and parquet checksums
+    """
+    from importlib.metadata import version, PackageNotFoundError
+    
+    tables = [ENTITY_TABLE, COMMUNITY_TABLE, RELATIONSHIP_TABLE, COMMUNITY_REPORT_TABLE, TEXT_UNIT_TABLE]
+    if use_covariates:
+        tables.append(COVARIATE_TABLE)
+    checksums = {}
+    for table in tables:
+        with open(f"{input_dir}/{table}.parquet", "rb") as f:
+            checksums[table] = hashlib.sha256(f.read()).hexdigest()
+    try:
+        graphrag_version = version("graphrag")
+    except PackageNotFoundError:
+        graphrag_version = None
+    return {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "graphrag_version": graphrag_version,
+        "community_level": community_level,
+        "use_covariates": use_covariates,
+        "checksums": checksums,
+    }
+
+
+def save_index_snapshot(index: Dict[str, Any], snapshot_path: str, header: Dict[str, Any]) -> str:
+    """
+    Serialize the fully constructed index objects into one versioned snapshot file.
+    
+    Args:
+        index: Objects returned by read_index_from_parquet
+        snapshot_path: Output path
+        header: Header from snapshot_header describing the source data
+        
+    Returns:
+        str: Path of the written snapshot
+    """
+    # Unique per writer, so worker processes starting cold together don't write into one file;
+    # os.replace then installs whichever complete snapshot finishes last
+    tmp_path = f"{snapshot_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            # Header first so load_index_snapshot can reject a stale file without unpickling the objects
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return snapshot_path
+
+
+def load_index_snapshot(snapshot_path: str, header: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Load index objects from a snapshot file. The file is a pickle, so only load
+    snapshots written locally by save_index_snapshot.
+    
+    Args:
+        snapshot_path: Snapshot path
+        header: Expected header from snapshot_header
+        
+    Returns:
+        Optional[Dict[str, Any]]: The index objects, or None if the snapshot is missing or stale
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        with open(snapshot_path, "rb") as f:
+            if pickle.load(f) != header:
+                print(f"GraphRAG index snapshot {snapshot_path} is stale, rebuilding from parquet")
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        # A damaged pickle can raise almost anything; parquet is still there to rebuild from
+        print(f"Could not load GraphRAG index snapshot {snapshot_path}, rebuilding from parquet: {e}")
+        return None
+
+
 # Example usage
 async def query_graphrag(question: str) -> str:
     """
@@ -228,4 +483,19 @@ async def query_graphrag(question: str) -> str:
     """
     engine = GraphRAGSearchEngine()
     response = (await engine.search(question)).response
-    return response
\ No newline at end of file
+    return response
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Build the precompiled GraphRAG index snapshot")
+    parser.add_argument("--input-dir", default="./output", help="Directory containing the indexed data")
+    parser.add_argument("--community-level", type=int, default=2)
+    parser.add_argument("--snapshot-path", help="Output path (defaults to {input_dir}/index_snapshot.pkl)")
+    args = parser.parse_args()
+    
+    index = read_index_from_parquet(args.input_dir, args.community_level)
+    header = snapshot_header(args.input_dir, args.community_level)
+    path = save_index_snapshot(index, args.snapshot_path or f"{args.input_dir}/index_snapshot.pkl", header)
+    print(f"Snapshot written to {path}")
@@ -0,0 +1,394 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import traceback
+
+from scheduler import Overloaded, background_calls
+
+# Running jobs whose worker process stopped renewing their lease this long ago are requeued
+JOB_LEASE_SECONDS = 15 * 60
+# Fraction of the lease after which a worker process renews the leases of its running jobs
+LEASE_RENEW_FRACTION = 1 / 3
+# Finished jobs (with their extracted and simplified text) are deleted after this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 60 * 60)))
+# How often a running worker pool deletes expired finished jobs
+JOB_PURGE_INTERVAL_SECONDS = 5 * 60
+# Attempts before a job that keeps getting shed by the scheduler is failed
+MAX_ATTEMPTS = 5
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    client_id TEXT,
+    payload TEXT NOT NULL,
+    result TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by a local SQLite file.
+
+    Jobs and their partial results live in the database, so queued and half-finished jobs
+    survive a process restart: running jobs whose owning process is gone are requeued by
+    recover_orphaned(), and jobs whose lease expired are requeued by claim(). The owning
+    process renews the lease with renew_leases() while its jobs run, and only the owner can
+    update, finish or fail a running job. Requeued jobs keep their partial results so
+    handlers can skip the stages that already finished.
+
+    Args:
+        db_path (str): Path of the SQLite database file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # The random suffix tells a restarted process apart from its predecessor with the same pid
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.new_job = threading.Event()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Connection(conn)
+
+    def submit(self, kind, payload, client_id=None):
+        """
+        Add a job to the queue.
+
+        Args:
+            kind (str): Job type, used to pick the handler
+            payload (dict): JSON-serializable job input
+            client_id (str, optional): Client that submitted the job
+
+        Returns:
+            str: The new job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, stage, client_id, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, QUEUED, client_id, json.dumps(payload), now, now),
+            )
+        self.new_job.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Look up a job.
+
+        Returns:
+            dict: The job with decoded payload and result, or None if it does not exist
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def claim(self):
+        """
+        Atomically take the oldest runnable job and mark it running for this process.
+
+        Returns:
+            dict: The claimed job, or None if nothing is runnable
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = conn.execute(
+                    "SELECT id, owner FROM jobs WHERE status = ? AND updated_at < ?",
+                    (RUNNING, now - JOB_LEASE_SECONDS),
+                ).fetchall()
+                for job in expired:
+                    if self._owner_gone(job["owner"]):
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, stage = ?, owner = NULL WHERE id = ?",
+                            (QUEUED, QUEUED, job["id"]),
+                        )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND not_before <= ? ORDER BY created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (RUNNING, self.owner, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = _row_to_job(row)
+        job["status"] = RUNNING
+        job["attempts"] += 1
+        return job
+
+    def _owner_gone(self, owner):
+        """
+        Whether the process that owns a running job no longer exists. Owners on other hosts
+        can't be checked directly; their expired lease means they stopped renewing it.
+        """
+        if owner == self.owner:
+            return False
+        host, pid = ((owner or "").split(":") + ["", ""])[:2]
+        if host != socket.gethostname() or not pid.isdigit():
+            return True
+        # Same pid with another owner id is an earlier incarnation of this process
+        return int(pid) == os.getpid() or not _pid_alive(int(pid))
+
+    def renew_leases(self):
+        """Mark this process's running jobs as alive, so claim() does not requeue them."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE status = ? AND owner = ?",
+                (time.time(), RUNNING, self.owner),
+            )
+
+    def update(self, job_id, stage=None, status=None, **partial):
+        """
+        Record progress: move the job to a new stage and merge partial results.
+        Ignored unless this process owns the job, so a requeued job's old run can't
+        overwrite the new one.
+
+        Args:
+            job_id (str): The job id
+            stage (str, optional): New stage name
+            status (str, optional): New status (used when the job finishes)
+            **partial: Result fields to merge into the job's result
+
+        Returns:
+            bool: True if the job was updated
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT result, stage, status FROM jobs WHERE id = ? AND status = ? AND owner = ?",
+                    (job_id, RUNNING, self.owner),
+                ).fetchone()
+                if row is not None:
+                    result = json.loads(row["result"])
+                    result.update(partial)
+                    conn.execute(
+                        "UPDATE jobs SET stage = ?, status = ?, result = ?, updated_at = ? WHERE id = ?",
+                        (stage or row["stage"], status or row["status"], json.dumps(result), time.time(), job_id),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    def finish(self, job_id, result):
+        return self.update(job_id, stage=DONE, status=DONE, **result)
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND owner = ?",
+                (FAILED, FAILED, error, time.time(), job_id, RUNNING, self.owner),
+            )
+        return cursor.rowcount > 0
+
+    def retry_later(self, job_id, delay):
+        """Put a running job back in the queue, runnable after `delay` seconds, keeping its partial results."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, owner = NULL, not_before = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND owner = ?",
+                (QUEUED, QUEUED, now + delay, now, job_id, RUNNING, self.owner),
+            )
+        return cursor.rowcount > 0
+
+    def recover_orphaned(self):
+        """
+        Requeue jobs left running by a process on this host that no longer exists,
+        e.g. after a crash or restart.
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        hostname = socket.gethostname()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, owner FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            # Owners on other hosts are left to lease expiry
+            orphaned = [
+                row["id"] for row in rows
+                if (row["owner"] or "").split(":")[0] == hostname and self._owner_gone(row["owner"])
+            ]
+            for job_id in orphaned:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                    (QUEUED, QUEUED, time.time(), job_id),
+                )
+        if orphaned:
+            self.new_job.set()
+        return len(orphaned)
+
+    def purge_finished(self, older_than=None):
+        """
+        Delete done and failed jobs older than `older_than` seconds (default JOB_RETENTION_SECONDS).
+
+        Returns:
+            int: Number of jobs deleted
+        """
+        older_than = JOB_RETENTION_SECONDS if older_than is None else older_than
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+        return cursor.rowcount
+
+
+class _Connection:
+    """Context manager that closes the SQLite connection (sqlite3's own only ends transactions)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+def _row_to_job(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"])
+    return job
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobWorkerPool:
+    """
+    Background threads that claim jobs from a JobQueue and run the handler for their kind.
+
+    A handler is called as handler(job, report) where report(stage, **partial) records progress
+    and partial results, and returns the final result dict. job["result"] holds the partial
+    results of earlier attempts, if any. Handlers run inside scheduler.background_calls(), so
+    their LLM calls wait in the queue instead of being shed as quickly as interactive ones. If
+    a handler raises Overloaded the job is requeued after the suggested delay; any other
+    exception fails the job. While handlers run, a maintenance thread renews the leases of
+    this process's jobs so long stages are not mistaken for lost ones, and deletes finished
+    jobs older than JOB_RETENTION_SECONDS every JOB_PURGE_INTERVAL_SECONDS.
+
+    Args:
+        queue (JobQueue): The queue to consume
+        handlers (dict): Job kind -> handler function
+        num_workers (int): Number of worker threads
+        poll_interval (float): Seconds between polls when the queue is idle
+    """
+
+    def __init__(self, queue, handlers, num_workers=4, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        requeued = self.queue.recover_orphaned()
+        if requeued:
+            print(f"Requeued {requeued} job(s) interrupted by a previous shutdown")
+        self.queue.purge_finished()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name="job-maintenance", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.queue.new_job.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.queue.new_job.wait(self.poll_interval)
+                self.queue.new_job.clear()
+                continue
+            self._execute(job)
+
+    def _maintain(self):
+        interval = min(JOB_LEASE_SECONDS * LEASE_RENEW_FRACTION, JOB_PURGE_INTERVAL_SECONDS)
+        last_purge = time.monotonic()
+        while not self._stop.wait(interval):
+            try:
+                self.queue.renew_leases()
+                if time.monotonic() - last_purge >= JOB_PURGE_INTERVAL_SECONDS:
+                    self.queue.purge_finished()
+                    last_purge = time.monotonic()
+            except Exception as e:
+                print(f"Error maintaining the job queue: {e}")
+
+    def _execute(self, job):
+        job_id = job["id"]
+
+        def report(stage, **partial):
+            self.queue.update(job_id, stage=stage, **partial)
+
+        try:
+            with background_calls():
+                result = self.handlers[job["kind"]](job, report)
+        except Overloaded as e:
+            if job["attempts"] >= MAX_ATTEMPTS:
+                self.queue.fail(job_id, "The service is busy. Please try again later.")
+            else:
+                self.queue.retry_later(job_id, e.retry_after)
+            return
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+            traceback.print_exc()
+            self.queue.fail(job_id, str(e))
+            return
+        self.queue.finish(job_id, result)
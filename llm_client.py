@@ -0,0 +1,28 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the OpenAI client shared by the whole app, creating it on first use.
+
+    The openai package is imported here rather than at module import so the server can
+    bind before the client library is loaded.
+
+    Returns:
+        OpenAI: The shared client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv("GRAPHRAG_API_KEY"))
+    return _client
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a fast classification call up to a long GraphRAG answer
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# USD per 1K tokens as (prompt, completion). Models not listed here are counted as zero cost.
+MODEL_PRICING = {
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "text-embedding-3-small": (0.00002, 0.0),
+    "text-embedding-3-large": (0.00013, 0.0),
+    "text-embedding-ada-002": (0.0001, 0.0),
+}
+
+# Set AIMEDNOW_TRACE_LOG=1 to print one JSON line per finished span
+TRACE_LOG = os.getenv("AIMEDNOW_TRACE_LOG", "0") == "1"
+
+_current_span = contextvars.ContextVar("aimednow_current_span", default=None)
+
+
+class _Histogram:
+    """Fixed-bucket histogram. Bucket counts are stored per bucket and made cumulative on render."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters and histograms keyed by metric name and labels.
+
+    Every update is a dict lookup and a few additions under a single lock, which keeps the
+    cost per span in the microsecond range so it can stay enabled in production.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = float(value)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def counter_total(self, name, **labels):
+        """Sum of a counter over all label sets that include `labels`."""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(
+                value for (counter, counter_labels), value in self._counters.items()
+                if counter == name and wanted <= set(counter_labels)
+            )
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page served by /metrics
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {
+                key: (list(h.buckets), list(h.counts), h.sum, h.count)
+                for key, h in self._histograms.items()
+            }
+
+        lines = []
+        seen = set()
+
+        def header(name, metric_type):
+            if name in seen:
+                return
+            seen.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                le_labels = labels + (("le", _format_value(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(le_labels)} {cumulative}")
+            le_labels = labels + (("le", "+Inf"),)
+            lines.append(f"{name}_bucket{_format_labels(le_labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """
+    Estimate the USD cost of an LLM call from MODEL_PRICING.
+
+    Args:
+        model (str): Model name as sent to the API (dated snapshots match their base name)
+        prompt_tokens (int): Prompt tokens reported by the API
+        completion_tokens (int): Completion tokens reported by the API
+
+    Returns:
+        float: Estimated cost in USD, 0.0 for unknown models
+    """
+    if not model:
+        return 0.0
+    # Longest prefix wins so "gpt-4o-mini-2024-07-18" is not priced as "gpt-4"
+    for name in sorted(MODEL_PRICING, key=len, reverse=True):
+        if model.startswith(name):
+            prompt_price, completion_price = MODEL_PRICING[name]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000.0
+    return 0.0
+
+
+registry = MetricsRegistry()
+registry.describe("aimednow_stage_duration_seconds", "Latency of each pipeline stage")
+registry.describe("aimednow_llm_tokens_total", "Prompt and completion tokens (source=api from usage fields, source=estimate from tokenizer counts)")
+registry.describe("aimednow_llm_cost_usd_total", "Estimated LLM spend in USD (source as for aimednow_llm_tokens_total)")
+registry.describe("aimednow_http_request_duration_seconds", "Latency of HTTP requests by endpoint")
+registry.describe("aimednow_llm_truncated_total", "Completions cut off by max_tokens (finish_reason=length)")
+
+
+def record_stage(stage, seconds, status="ok", model=None, prompt_tokens=0, completion_tokens=0, truncated=0,
+                 estimated=False):
+    """
+    Record one finished pipeline stage: its latency and, if it called an LLM, tokens and cost.
+
+    Args:
+        stage (str): Stage name, e.g. "classify_emergency" or "graphrag.context"
+        seconds (float): Wall-clock duration of the stage
+        status (str): "ok" or "error"
+        model (str, optional): Model that served the stage
+        prompt_tokens (int): Prompt tokens used by the stage
+        completion_tokens (int): Completion tokens used by the stage
+        truncated (int): Completions in the stage that hit max_tokens
+        estimated (bool): Token counts come from a tokenizer rather than the API's usage fields
+    """
+    registry.observe("aimednow_stage_duration_seconds", seconds, stage=stage, status=status)
+    if prompt_tokens or completion_tokens:
+        model = model or "unknown"
+        source = "estimate" if estimated else "api"
+        registry.inc("aimednow_llm_tokens_total", prompt_tokens, stage=stage, model=model, kind="prompt", source=source)
+        registry.inc("aimednow_llm_tokens_total", completion_tokens, stage=stage, model=model, kind="completion", source=source)
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        if cost:
+            registry.inc("aimednow_llm_cost_usd_total", cost, stage=stage, model=model, source=source)
+    if truncated:
+        registry.inc("aimednow_llm_truncated_total", truncated, stage=stage, model=model or "unknown")
+
+
+class Span:
+    """A single timed stage. Token usage is attached with record_usage() before the span ends."""
+
+    def __init__(self, stage, model=None, parent=None):
+        self.stage = stage
+        self.model = model
+        self.parent = parent
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.truncated = 0
+        self.estimated = False
+        self.start = time.perf_counter()
+
+    def record_usage(self, response, model=None):
+        """
+        Add the token counts from an OpenAI response's `usage` field to this span, and note
+        whether the completion was cut off by max_tokens.
+
+        Args:
+            response: A chat completion or embedding response from the OpenAI client
+            model (str, optional): Overrides the model name taken from the response
+        """
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        choices = getattr(response, "choices", None) or []
+        if choices and getattr(choices[0], "finish_reason", None) == "length":
+            self.truncated += 1
+        self.model = model or self.model or getattr(response, "model", None)
+
+    def add_tokens(self, prompt_tokens=0, completion_tokens=0, model=None, estimated=False):
+        """
+        Add token counts that did not come from an API response.
+
+        Args:
+            prompt_tokens (int): Prompt tokens
+            completion_tokens (int): Completion tokens
+            model (str, optional): Model name
+            estimated (bool): The counts are tokenizer estimates, not API usage; the span's
+                tokens and cost are then recorded with source="estimate"
+        """
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+        self.model = model or self.model
+        self.estimated = self.estimated or estimated
+
+
+@contextmanager
+def span(stage, model=None):
+    """
+    Time a pipeline stage and record it in the metrics registry.
+
+    Usage:
+        with span("note.ocr", model=model) as s:
+            response = client.chat.completions.create(...)
+            s.record_usage(response)
+
+    Args:
+        stage (str): Stage name used as the `stage` label
+        model (str, optional): Model that serves the stage
+
+    Yields:
+        Span: The running span
+    """
+    current = Span(stage, model=model, parent=_current_span.get())
+    token = _current_span.set(current)
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_span.reset(token)
+        elapsed = time.perf_counter() - current.start
+        record_stage(
+            stage,
+            elapsed,
+            status=status,
+            model=current.model,
+            prompt_tokens=current.prompt_tokens,
+            completion_tokens=current.completion_tokens,
+            truncated=current.truncated,
+            estimated=current.estimated,
+        )
+        if TRACE_LOG:
+            print(json.dumps({
+                "span": stage,
+                "parent": current.parent.stage if current.parent else None,
+                "duration_ms": round(elapsed * 1000, 2),
+                "status": status,
+                "model": current.model,
+                "prompt_tokens": current.prompt_tokens,
+                "completion_tokens": current.completion_tokens,
+                "estimated": current.estimated,
+            }))
+
+
+def render_prometheus():
+    """Return the current metrics in Prometheus text format."""
+    return registry.render()
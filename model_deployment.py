@@ -1,118 +1,271 @@
-import io
 import json
-from PIL import Image
-from flask import Flask, jsonify, request, render_template, send_from_directory
+import time
+import uuid
+import threading
+from flask import Flask, jsonify, request, render_template, send_from_directory, g, Response, url_for
 import os
 from werkzeug.utils import secure_filename
-import base64
-from openai import OpenAI
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from emergency_classifier import process_question_sync
+from emergency_classifier import process_question_sync, warm_up_engine
 from doctor_note_processor import process_doctor_note
+from document_pages import DOCUMENT_EXTENSIONS, MAX_PAGES, count_pages, load_pages, too_many_pages_message
+from llm_client import get_client
+from metrics import span, registry, render_prometheus
+from scheduler import llm_scheduler, Overloaded, SIMPLIFY, estimate_tokens
+from jobs import JobQueue, JobWorkerPool, MAX_ATTEMPTS
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("GRAPHRAG_API_KEY"))
-
 client_model = "gpt-4o"  #"qwen2-vl"
 
 UPLOAD_FOLDER = './upload_images'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = DOCUMENT_EXTENSIONS
 
-def encode_image(image_path):
-    # from https://community.openai.com/t/how-to-load-a-local-image-to-gpt4-vision-using-api/533090/3
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# Upload jobs are persisted here so they survive a restart
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", './jobs/jobs.db')
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
 
 def get_answer2question_from_image(base64_image, question, extra_body=None, temperature=0.5):
 
-    chat_response = client.chat.completions.create(
-        model=os.getenv("MODEL_NAME"),
-        messages=[
-            {
-                "role": "system",
-                "content": [
-                    {"type": "text", "text": "You're a helpful agent."}
-                ]
-            },
-            {
-                "role": "user",
-                "content": [
-                    # NOTE: The prompt formatting with the image token `<image>` is not needed
-                    # since the prompt will be processed automatically by the API server.
-                    {"type": "text", "text": question},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
-                ],
-            },
-        ],
-        temperature=temperature,
-        extra_body=extra_body
-    )
-    print(chat_response)
+    model = os.getenv("MODEL_NAME")
+    with llm_scheduler.slot(SIMPLIFY, estimate_tokens(question, 1000 + 300)), \
+            span("image.describe", model=model) as s:
+        chat_response = get_client().chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": [
+                        {"type": "text", "text": "You're a helpful agent."}
+                    ]
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        # NOTE: The prompt formatting with the image token `<image>` is not needed
+                        # since the prompt will be processed automatically by the API server.
+                        {"type": "text", "text": question},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+                    ],
+                },
+            ],
+            temperature=temperature,
+            extra_body=extra_body
+        )
+        s.record_usage(chat_response)
     return chat_response.choices[0].message.content
 
 # app = Flask(__name__)
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 
+# Fast-start mode: build the GraphRAG engine in the background as soon as the app is created,
+# so it is ready before the first request. The debug reloader's parent process never serves
+# requests, so it skips the warm-up.
+FAST_START = os.getenv("AIMEDNOW_FAST_START", "0") == "1"
+if FAST_START and not (__name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true"):
+    warm_up_engine()
+
 CORS(app)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+# Number of reverse proxies in front of the app. Only then is X-Forwarded-For trusted,
+# and only the hops those proxies appended; otherwise clients could pick their own id.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    if request.endpoint != 'metrics' and hasattr(g, 'request_start'):
+        registry.observe(
+            "aimednow_http_request_duration_seconds",
+            time.perf_counter() - g.request_start,
+            endpoint=request.endpoint or 'unknown',
+            status=response.status_code,
+        )
+    return response
+
+def client_id():
+    """Identify the caller for per-client rate limits (set from X-Forwarded-For by ProxyFix behind trusted proxies)."""
+    return request.remote_addr or 'unknown'
+
+def overloaded_response(error):
+    """Fast "retry later" response for rate-limited or shed requests."""
+    response = jsonify({
+        'error': str(error),
+        'answer': f"The service is busy right now. Please try again in {error.retry_after} seconds."
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def remove_files(filepaths):
+    for filepath in filepaths:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+def describe_first_page(page, page_count):
+    """Short description of an upload, from its first page, used to decide whether it is a doctor's note."""
+    if page["image"] is None:
+        # PDF page with a text layer: the text itself says what the document is
+        return f"A {page_count}-page PDF document whose first page reads: {page['text'][:500]}"
+    return get_answer2question_from_image(
+        page["image"],
+        "Describe in 100 words or less what is in the image."
+    )
+
+def run_upload_job(job, report):
+    """
+    Job handler for uploaded images and PDFs: describe the first page, then run the
+    doctor's note pipeline on all pages, reporting each stage's output as soon as it
+    is available.
+
+    Args:
+        job (dict): The claimed job; payload holds the saved file paths
+        report (callable): report(stage, **partial_results) progress callback
+
+    Returns:
+        dict: The final result, same fields the synchronous endpoint used to return
+    """
+    # Jobs queued before multi-file uploads carry a single 'filepath'
+    filepaths = job['payload'].get('filepaths') or [job['payload']['filepath']]
+    # A retried job keeps the stages finished by earlier attempts
+    previous = job['result']
+    try:
+        # Split the upload into pages (one per image, one per PDF page)
+        report('describing')
+        pages = load_pages(filepaths)
+        if not pages:
+            raise ValueError("The uploaded document has no pages.")
+
+        # First get a general description of the document
+        initial_description = previous.get('answer') or describe_first_page(pages[0], len(pages))
+        report('checking', answer=initial_description)
+
+        # Check if the document is a doctor's note and process it if it is
+        doc_note_result = process_doctor_note(pages, initial_description, on_progress=report, previous=previous)
+    except Overloaded:
+        # Keep the files so the retry can use them
+        if job['attempts'] >= MAX_ATTEMPTS:
+            remove_files(filepaths)
+        raise
+    except Exception:
+        remove_files(filepaths)
+        raise
+    remove_files(filepaths)
+
+    # If it's a doctor's note, return the processed information
+    if doc_note_result.get("is_doctor_note", False):
+        return {
+            'answer': initial_description,
+            'is_doctor_note': True,
+            'original_text': doc_note_result["original_text"],
+            'simplified_text': doc_note_result["simplified_text"]
+        }
+    # If it's not a doctor's note, just return the initial description
+    return {
+        'answer': initial_description,
+        'is_doctor_note': False
+    }
+
+job_queue = JobQueue(JOB_DB_PATH)
+job_workers = JobWorkerPool(job_queue, {'upload_ehr': run_upload_job}, num_workers=JOB_WORKERS)
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_services():
+    """Start the job workers once per process."""
+    global _background_started
+    with _background_lock:
+        if not _background_started:
+            job_workers.start()
+            _background_started = True
+
+@app.before_request
+def ensure_background_services():
+    # Covers WSGI servers that never run the __main__ block
+    if not _background_started:
+        start_background_services()
+
+def job_response(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'result': job['result'],
+        'error': job['error'],
+    }
+
 @app.route('/api/upload_ehr', methods=['POST', 'GET'])
 def upload_ehr():
     if request.method == 'POST':
-        file = request.files['file']
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            # Get base64 encoded image
-            base64_image = encode_image(filepath)
-            
-            # First get a general description of the image
-            initial_description = get_answer2question_from_image(
-                base64_image, 
-                "Describe in 100 words or less what is in the image."
-            )
-            
-            # Check if the image is a doctor's note and process it if it is
-            doc_note_result = process_doctor_note(base64_image, initial_description)
-            
-            # If it's a doctor's note, return the processed information
-            if doc_note_result.get("is_doctor_note", False):
-                response = {
-                    'answer': initial_description,
-                    'is_doctor_note': True,
-                    'original_text': doc_note_result["original_text"],
-                    'simplified_text': doc_note_result["simplified_text"]
-                }
-            else:
-                # If it's not a doctor's note, just return the initial description
-                response = {
-                    'answer': initial_description,
-                    'is_doctor_note': False
-                }
-            
-            file.close()
-            os.remove(filepath)
-            return jsonify(response)
+        try:
+            llm_scheduler.check_client(client_id())
+        except Overloaded as e:
+            return overloaded_response(e)
+        # Several images (or PDFs) uploaded together are processed as one document, in order
+        files = [file for file in request.files.getlist('file') if file and allowed_file(file.filename)]
+        if files:
+            filepaths = []
+            for file in files:
+                # Prefix with a random id so concurrent uploads with the same name don't collide
+                filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                file.save(filepath)
+                file.close()
+                filepaths.append(filepath)
+
+            # Reject oversized documents before any page is rendered or OCR'd
+            try:
+                page_count = count_pages(filepaths)
+            except Exception as e:
+                print(f"Error counting pages of upload: {e}")
+                remove_files(filepaths)
+                message = "The uploaded PDF could not be read."
+                return jsonify({'error': message, 'answer': message}), 400
+            if page_count > MAX_PAGES:
+                remove_files(filepaths)
+                message = too_many_pages_message(page_count)
+                return jsonify({'error': message, 'answer': message}), 413
+
+            job_id = job_queue.submit('upload_ehr', {'filepaths': filepaths}, client_id=client_id())
+            return jsonify({
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': url_for('job_status', job_id=job_id),
+            }), 202
+        return jsonify({'error': 'Please upload PNG or JPEG images or a PDF.'}), 400
 
     return '''
     <!doctype html>
     <title>Upload new File</title>
     <h1>Upload new File</h1>
     <form method=post enctype=multipart/form-data>
-      <input type=file name=file>
+      <input type=file name=file multiple>
       <input type=submit value=Upload>
     </form>
     '''
 
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a job: status, current stage and whatever partial results are ready."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_response(job))
+
 @app.route('/api/qna', methods=['POST'])
 def qna():
     data = request.get_json()
@@ -125,6 +278,7 @@ def qna():
         return jsonify({'error': 'No text provided'}), 400
 
     try:
+        llm_scheduler.check_client(client_id())
         # Process the question using our fixed emergency classification system
         response_data = process_question_sync(question)
         
@@ -138,6 +292,8 @@ def qna():
         print(f"Response classification: {response['classification']}, source: {response['source']}")
         return jsonify(response), 200
     
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in qna route: {e}")
         import traceback
@@ -145,6 +301,11 @@ def qna():
         return jsonify({'error': str(e), 'answer': "I'm sorry, I encountered an error processing your question."}), 500
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint with per-stage latency histograms and token/cost counters."""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -167,4 +328,8 @@ if __name__ == '__main__':
         print("Warning: nest_asyncio not installed. This may cause issues with async operations.")
         print("Install with: pip install nest_asyncio")
 
+    # With the debug reloader only the child process serves requests, so start workers there
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
+
     app.run(debug=True)
\ No newline at end of file
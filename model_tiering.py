@@ -0,0 +1,176 @@
+import os
+import re
+
+from metrics import registry
+
+# Notes at most this long (in words) with few medical terms go to the small model
+SMALL_NOTE_MAX_WORDS = 200
+SMALL_NOTE_MAX_DENSITY = 0.12
+# Completion cap for the small model: about 3x the note, within these bounds
+SMALL_NOTE_MIN_TOKENS = 600
+SMALL_NOTE_MAX_TOKENS = 1200
+LARGE_NOTE_MAX_TOKENS = 2000
+
+# Questions at most this long (in words) with few medical terms go to the small model
+SMALL_QUESTION_MAX_WORDS = 40
+SMALL_QUESTION_MAX_DENSITY = 0.10
+SMALL_ANSWER_MAX_TOKENS = 400
+LARGE_ANSWER_MAX_TOKENS = 1000
+
+# Words asked for in the prompt per token of completion cap. Text runs about 0.75 words
+# per token, so the model aims well below the cap instead of being cut off by it.
+BUDGET_WORDS_PER_TOKEN = 0.5
+
+# Clinical abbreviations common in notes and prescriptions
+MEDICAL_ABBREVIATIONS = {
+    "a1c", "afib", "bid", "bmp", "bp", "cad", "cbc", "chf", "copd", "ct", "cxr", "dm", "dx",
+    "ecg", "ekg", "gerd", "hdl", "hr", "htn", "hx", "im", "iv", "ldl", "mcg", "mg", "mi", "ml",
+    "mri", "nsaid", "nsaids", "po", "prn", "qd", "qhs", "qid", "rx", "sc", "sob", "subq", "sx",
+    "tid", "tx", "uri", "uti",
+}
+
+# Word endings of anatomical/pathological jargon and common drug classes
+MEDICAL_SUFFIXES = (
+    "itis", "ectomy", "otomy", "ostomy", "plasty", "osis", "emia", "algia", "pathy", "scopy",
+    "megaly", "penia", "plegia", "rrhea", "cardia", "uria", "oma",
+    "pril", "olol", "statin", "sartan", "cillin", "mycin", "azole", "dipine", "oxacin",
+    "tidine", "formin", "lukast", "olone", "azepam",
+)
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9\-]*")
+
+registry.describe("aimednow_model_tier_total", "LLM calls routed to each model tier")
+
+
+class Tier:
+    """
+    Model choice for one LLM call.
+
+    Attributes:
+        name (str): "small" or "large"
+        model (str): Model name sent to the API
+        max_tokens (int): Completion cap, None for no cap
+        reason (str): Why this tier was picked, used as a metric label
+    """
+
+    def __init__(self, name, model, max_tokens, reason):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.reason = reason
+
+    def with_length_budget(self, system_prompt):
+        """
+        Add the tier's length budget to a system prompt, so the model plans an answer
+        that fits max_tokens instead of being cut off.
+
+        Args:
+            system_prompt (str): The system prompt
+
+        Returns:
+            str: The system prompt, with a word budget appended when the tier is capped
+        """
+        if self.max_tokens is None:
+            return system_prompt
+        words = int(self.max_tokens * BUDGET_WORDS_PER_TOKEN)
+        return f"{system_prompt} Keep your response under {words} words; be concise and cover the most important points first."
+
+    def __repr__(self):
+        return f"Tier({self.name!r}, {self.model!r}, max_tokens={self.max_tokens}, reason={self.reason!r})"
+
+
+def tiering_enabled():
+    """
+    Tiering is on when SMALL_MODEL_NAME is set, unless MODEL_TIERING=0. Otherwise everything
+    goes to MODEL_NAME as before, so deployments serving other model families are unaffected.
+    """
+    return os.getenv("MODEL_TIERING", "1") != "0" and bool(small_model())
+
+
+def large_model():
+    return os.getenv("MODEL_NAME", "gpt-4")
+
+
+def small_model():
+    # An empty SMALL_MODEL_NAME= line in .env counts as unset
+    return os.getenv("SMALL_MODEL_NAME", "").strip()
+
+
+def is_medical_term(word):
+    word = word.lower()
+    if word in MEDICAL_ABBREVIATIONS:
+        return True
+    return len(word) > 5 and word.endswith(MEDICAL_SUFFIXES)
+
+
+def medical_term_density(text):
+    """
+    Share of words in a text that are medical jargon or clinical abbreviations.
+
+    Args:
+        text (str): OCR text or question
+
+    Returns:
+        tuple: (word count, density between 0 and 1)
+    """
+    words = _WORD_RE.findall(text or "")
+    if not words:
+        return 0, 0.0
+    terms = sum(1 for word in words if is_medical_term(word))
+    return len(words), terms / len(words)
+
+
+def _record(task, tier):
+    registry.inc("aimednow_model_tier_total", task=task, tier=tier.name, reason=tier.reason)
+    return tier
+
+
+def simplification_tier(medical_text):
+    """
+    Pick the model and completion cap for simplifying a doctor's note.
+
+    Short notes with little jargon go to the small model with a cap scaled to the note.
+    Long or term-dense notes go to the large model.
+
+    Args:
+        medical_text (str): The OCR text of the note
+
+    Returns:
+        Tier: The model choice
+    """
+    if not tiering_enabled():
+        return _record("simplify", Tier("large", large_model(), LARGE_NOTE_MAX_TOKENS, "tiering_disabled"))
+    words, density = medical_term_density(medical_text)
+    if words > SMALL_NOTE_MAX_WORDS:
+        return _record("simplify", Tier("large", large_model(), LARGE_NOTE_MAX_TOKENS, "long_note"))
+    if density > SMALL_NOTE_MAX_DENSITY:
+        return _record("simplify", Tier("large", large_model(), LARGE_NOTE_MAX_TOKENS, "term_dense"))
+    # The simplified note adds definitions, step lists and a summary, so it runs longer than the original
+    max_tokens = min(SMALL_NOTE_MAX_TOKENS, max(SMALL_NOTE_MIN_TOKENS, 3 * (len(medical_text) // 4)))
+    return _record("simplify", Tier("small", small_model(), max_tokens, "short_note"))
+
+
+def general_answer_tier(question, classification="non-emergency"):
+    """
+    Pick the model and completion cap for a general (GraphRAG-free) answer.
+
+    Emergency fallbacks always use the large model, without a completion cap. Short
+    questions with little jargon go to the small model.
+
+    Args:
+        question (str): The user's question
+        classification (str): "non-emergency" or "emergency-fallback"
+
+    Returns:
+        Tier: The model choice
+    """
+    if not tiering_enabled():
+        return _record("general", Tier("large", large_model(), None, "tiering_disabled"))
+    if classification != "non-emergency":
+        return _record("general", Tier("large", large_model(), None, "emergency_fallback"))
+    words, density = medical_term_density(question)
+    if words > SMALL_QUESTION_MAX_WORDS:
+        return _record("general", Tier("large", large_model(), LARGE_ANSWER_MAX_TOKENS, "long_question"))
+    if density > SMALL_QUESTION_MAX_DENSITY:
+        return _record("general", Tier("large", large_model(), LARGE_ANSWER_MAX_TOKENS, "term_dense"))
+    return _record("general", Tier("small", small_model(), SMALL_ANSWER_MAX_TOKENS, "simple_question"))
@@ -0,0 +1,276 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from metrics import registry
+
+# Priorities, lowest value is served first
+EMERGENCY = 0
+GENERAL = 1
+SIMPLIFY = 2
+PRIORITY_NAMES = {EMERGENCY: "emergency", GENERAL: "general", SIMPLIFY: "simplify"}
+
+# Requests allowed to wait at or ahead of a priority before new ones are shed
+MAX_QUEUE_DEPTH = {EMERGENCY: 64, GENERAL: 32, SIMPLIFY: 16}
+# Longest a request may wait for a slot before it is shed (seconds)
+MAX_QUEUE_WAIT = {EMERGENCY: 60.0, GENERAL: 30.0, SIMPLIFY: 20.0}
+# Background jobs are already queued, so their calls wait this long before being shed instead
+BACKGROUND_QUEUE_WAIT = float(os.getenv("BACKGROUND_QUEUE_WAIT", "600"))
+
+_background = contextvars.ContextVar("aimednow_background_llm_calls", default=False)
+
+# Idle per-client buckets are dropped this often, or sooner once this many are held
+CLIENT_BUCKET_SWEEP_SECONDS = 60.0
+MAX_CLIENT_BUCKETS = 10_000
+
+registry.describe("aimednow_scheduler_queue_wait_seconds", "Time LLM calls waited for a scheduler slot")
+registry.describe("aimednow_scheduler_shed_total", "Requests rejected by admission control or load shedding")
+registry.describe("aimednow_scheduler_queue_depth", "LLM calls currently waiting for a slot")
+registry.describe("aimednow_scheduler_in_flight", "LLM calls currently running")
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is rejected by rate limiting or load shedding.
+
+    Attributes:
+        retry_after (int): Seconds the client should wait before retrying
+        status_code (int): 429 for per-client rate limits, 503 for global overload
+    """
+
+    def __init__(self, message, retry_after=5, status_code=503):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+        self.status_code = status_code
+
+
+@contextmanager
+def background_calls():
+    """
+    Mark the LLM calls made inside this block (e.g. by a job worker) as background work:
+    they still queue by priority, but are not limited by MAX_QUEUE_DEPTH and wait up to
+    BACKGROUND_QUEUE_WAIT instead of MAX_QUEUE_WAIT. Threads started inside the block
+    need contextvars.copy_context() to inherit it.
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class TokenBucket:
+    """
+    Classic token bucket. Not thread-safe on its own; callers hold the scheduler lock.
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Maximum tokens held
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now=None):
+        """Seconds until `amount` tokens are available (0 if they are available now)."""
+        now = now if now is not None else time.monotonic()
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now=None):
+        now = now if now is not None else time.monotonic()
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+def estimate_tokens(text, max_tokens):
+    """
+    Rough token estimate for an LLM call, used against the TPM budget.
+
+    Args:
+        text (str): Prompt text (about 4 characters per token)
+        max_tokens (int): Completion cap of the call
+
+    Returns:
+        int: Estimated prompt plus completion tokens
+    """
+    return len(text or "") // 4 + max_tokens
+
+
+class LLMScheduler:
+    """
+    Admission control and priority scheduling for upstream LLM calls.
+
+    Calls wait in a single priority queue (emergency answers, then general Q&A, then note
+    simplification; FIFO within a priority) and run once they reach the head, a concurrency
+    slot is free and the global RPM/TPM budgets allow it. When the queue is too deep or the
+    wait exceeds MAX_QUEUE_WAIT the call is shed with Overloaded so the client gets a fast
+    "retry later" instead of a proxy timeout. Per-client request rates are limited separately
+    with check_client().
+
+    Args:
+        max_concurrency (int): Upstream calls allowed in flight at once
+        rpm (int): Provider requests-per-minute budget, 0 to disable
+        tpm (int): Provider tokens-per-minute budget, 0 to disable
+        client_rpm (int): Requests per minute allowed per client, 0 to disable
+        client_burst (int): Burst size of the per-client bucket
+    """
+
+    def __init__(self, max_concurrency=8, rpm=0, tpm=0, client_rpm=30, client_burst=10):
+        self.max_concurrency = max_concurrency
+        self.rpm_bucket = TokenBucket(rpm / 60.0, rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm / 60.0, tpm) if tpm else None
+        self.client_rpm = client_rpm
+        self.client_burst = client_burst
+        self._client_buckets = {}
+        self._last_sweep = time.monotonic()
+        self._cond = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._active = 0
+
+    def _sweep_client_buckets(self, now):
+        """Drop buckets that have refilled to capacity; a new bucket would behave the same."""
+        for key, bucket in list(self._client_buckets.items()):
+            if bucket.wait_time(bucket.capacity, now) == 0:
+                del self._client_buckets[key]
+        self._last_sweep = now
+
+    def check_client(self, client_id):
+        """
+        Charge one request to a client's token bucket.
+
+        Args:
+            client_id (str): Client identifier (e.g. remote address)
+
+        Raises:
+            Overloaded: With status 429 if the client is over its rate limit
+        """
+        if not self.client_rpm:
+            return
+        with self._cond:
+            now = time.monotonic()
+            if (now - self._last_sweep > CLIENT_BUCKET_SWEEP_SECONDS
+                    or len(self._client_buckets) >= MAX_CLIENT_BUCKETS):
+                self._sweep_client_buckets(now)
+            bucket = self._client_buckets.get(client_id)
+            if bucket is None:
+                bucket = self._client_buckets[client_id] = TokenBucket(self.client_rpm / 60.0, self.client_burst)
+            wait = bucket.wait_time(1, now)
+            if wait > 0:
+                registry.inc("aimednow_scheduler_shed_total", reason="client_rate_limit")
+                raise Overloaded("Too many requests from this client.", retry_after=wait, status_code=429)
+            bucket.take(1, now)
+
+    def _rate_wait(self, estimated_tokens, now):
+        wait = 0.0
+        if self.rpm_bucket is not None:
+            wait = max(wait, self.rpm_bucket.wait_time(1, now))
+        if self.tpm_bucket is not None:
+            wait = max(wait, self.tpm_bucket.wait_time(estimated_tokens, now))
+        return wait
+
+    def _update_gauges(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _ in self._queue:
+            depth[PRIORITY_NAMES[priority]] += 1
+        for name, value in depth.items():
+            registry.set_gauge("aimednow_scheduler_queue_depth", value, priority=name)
+        registry.set_gauge("aimednow_scheduler_in_flight", self._active)
+
+    def _shed(self, ticket, priority, reason, retry_after):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._update_gauges()
+        self._cond.notify_all()
+        registry.inc("aimednow_scheduler_shed_total", priority=PRIORITY_NAMES[priority], reason=reason)
+        raise Overloaded("The service is busy, please retry later.", retry_after=retry_after)
+
+    @contextmanager
+    def slot(self, priority, estimated_tokens=1000):
+        """
+        Wait for permission to make one upstream LLM call.
+
+        Usage:
+            with llm_scheduler.slot(GENERAL, estimate_tokens(question, 1000)):
+                response = client.chat.completions.create(...)
+
+        Args:
+            priority (int): EMERGENCY, GENERAL or SIMPLIFY
+            estimated_tokens (int): Expected prompt plus completion tokens, charged to the TPM budget
+
+        Raises:
+            Overloaded: If the queue is full or the call waited longer than MAX_QUEUE_WAIT
+                (BACKGROUND_QUEUE_WAIT inside background_calls())
+        """
+        name = PRIORITY_NAMES[priority]
+        background = _background.get()
+        max_wait = BACKGROUND_QUEUE_WAIT if background else MAX_QUEUE_WAIT[priority]
+        enqueued = time.monotonic()
+        deadline = enqueued + max_wait
+        ticket = (priority, next(self._counter))
+
+        with self._cond:
+            ahead = sum(1 for queued_priority, _ in self._queue if queued_priority <= priority)
+            if not background and ahead >= MAX_QUEUE_DEPTH[priority]:
+                registry.inc("aimednow_scheduler_shed_total", priority=name, reason="queue_full")
+                raise Overloaded("The service is busy, please retry later.", retry_after=MAX_QUEUE_WAIT[priority] / 2)
+            heapq.heappush(self._queue, ticket)
+            self._update_gauges()
+
+            while True:
+                now = time.monotonic()
+                if self._queue[0] == ticket and self._active < self.max_concurrency:
+                    rate_wait = self._rate_wait(estimated_tokens, now)
+                    if rate_wait == 0:
+                        break
+                    if now + rate_wait > deadline:
+                        self._shed(ticket, priority, "rate_budget", rate_wait)
+                    self._cond.wait(rate_wait)
+                    continue
+                if now >= deadline:
+                    self._shed(ticket, priority, "queue_timeout", max_wait / 2)
+                self._cond.wait(deadline - now)
+
+            heapq.heappop(self._queue)
+            self._active += 1
+            if self.rpm_bucket is not None:
+                self.rpm_bucket.take(1, now)
+            if self.tpm_bucket is not None:
+                self.tpm_bucket.take(estimated_tokens, now)
+            self._update_gauges()
+            # The next ticket may be runnable as well
+            self._cond.notify_all()
+
+        registry.observe("aimednow_scheduler_queue_wait_seconds", time.monotonic() - enqueued, priority=name)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._update_gauges()
+                self._cond.notify_all()
+
+
+# Shared scheduler for every LLM call made by the app
+llm_scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    rpm=int(os.getenv("LLM_RPM_LIMIT", "0")),
+    tpm=int(os.getenv("LLM_TPM_LIMIT", "0")),
+    client_rpm=int(os.getenv("CLIENT_RPM_LIMIT", "30")),
+    client_burst=int(os.getenv("CLIENT_BURST", "10")),
+)
@@ -119,6 +119,82 @@ const handleToggleView = (e) => {
     }
 };
 
+// Progress messages shown while an upload job is running
+const JOB_STAGE_LABELS = {
+    queued: "Waiting in line...",
+    describing: "Looking at the image...",
+    checking: "Checking whether this is a doctor's note...",
+    ocr: "Reading the document...",
+    simplifying: "Translating the note into plain language...",
+    summarizing: "Writing a summary..."
+};
+
+// Page/section counters for multi-page documents, e.g. " (page 2 of 5)"
+const jobStageCount = (job) => {
+    const result = job.result || {};
+    if (job.stage === "ocr" && result.pages_total > 1) {
+        return ` (page ${result.pages_done} of ${result.pages_total})`;
+    }
+    if (job.stage === "simplifying" && result.sections_total > 1) {
+        return ` (part ${result.sections_done} of ${result.sections_total})`;
+    }
+    return "";
+};
+
+// Show the current stage and any partial results (the image description arrives first,
+// then the extracted text, then each simplified section as it finishes)
+const updateJobProgress = (responseDiv, job) => {
+    const chatDetails = responseDiv.querySelector(".chat-details");
+    let progressDiv = chatDetails.querySelector(".job-progress");
+    if (!progressDiv) {
+        progressDiv = document.createElement("div");
+        progressDiv.classList.add("job-progress");
+        chatDetails.appendChild(progressDiv);
+    }
+    const result = job.result || {};
+    let html = "";
+    if (result.answer) {
+        html += `<p>${result.answer}</p>`;
+    }
+    if (result.original_text) {
+        html += `<p>Extracted text:</p>${marked.parse(result.original_text)}`;
+    }
+    const simplifiedSections = (result.simplified_sections || []).filter(section => section);
+    if (simplifiedSections.length) {
+        html += `<p>Simplified so far:</p>${marked.parse(simplifiedSections.join("\n\n"))}`;
+    }
+    html += `<p><em>${JOB_STAGE_LABELS[job.stage] || "Working on it..."}${jobStageCount(job)}</em></p>`;
+    progressDiv.innerHTML = html;
+    chatContainer.scrollTo(0, chatContainer.scrollHeight);
+};
+
+// Poll an upload job until it finishes; resolves with the final result
+const waitForJob = (jobId, responseDiv) => {
+    const statusUrl = `http://localhost:5000/api/jobs/${jobId}`;
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(statusUrl).then(response => response.json().then(job => ({ ok: response.ok, job })))
+            .then(({ ok, job }) => {
+                // Failed, unknown or purged jobs stop polling and show the error
+                if (!ok || job.error || job.status === "failed") {
+                    responseDiv.querySelector(".job-progress")?.remove();
+                    resolve({ error: job.error, answer: job.error || "Error processing the file. Please try again." });
+                    return;
+                }
+                if (job.status === "done") {
+                    responseDiv.querySelector(".job-progress")?.remove();
+                    resolve(job.result);
+                    return;
+                }
+                updateJobProgress(responseDiv, job);
+                setTimeout(poll, 1000);
+            })
+            .catch(reject);
+        };
+        poll();
+    });
+};
+
 const createChatElement = (content, className) => {
     // Create new div and apply chat, specified class and set html content of div
     const chatDiv = document.createElement("div");
@@ -334,16 +410,17 @@ attachButton.addEventListener("click", () => {
 
 attachmentInput.addEventListener("change", function() {
     if (this.files && this.files[0]) {
-        const file = this.files[0];
+        // Several pages (images or PDFs) selected together are processed as one document
+        const files = Array.from(this.files);
         
         // Create file attachment display
-        const fileAttachment = createFileAttachment(file);
+        const fileAttachment = files.map(createFileAttachment).join("");
         
         // Create outgoing message with file attachment
         const html = `<div class="chat-content">
                         <div class="chat-details">
                             <img src="static/images/user.jpg" alt="user-img">
-                            <p>Uploaded: ${file.name}</p>
+                            <p>Uploaded: ${files.map(file => file.name).join(", ")}</p>
                             ${fileAttachment}
                         </div>
                     </div>`;
@@ -354,10 +431,10 @@ attachmentInput.addEventListener("change", function() {
         chatContainer.appendChild(outgoingChatDiv);
         chatContainer.scrollTo(0, chatContainer.scrollHeight);
         
-        // Process the file as an EHR if it's an image
-        if (file.type.startsWith('image/')) {
+        // Process the files as an EHR if they're images or PDFs
+        if (files.every(file => file.type.startsWith('image/') || file.type === 'application/pdf')) {
             let data = new FormData();
-            data.append('file', file);
+            files.forEach(file => data.append('file', file));
             
             // Create a custom typing animation for image uploads
             const animationHtml = `<div class="chat-content">
@@ -383,10 +460,24 @@ attachmentInput.addEventListener("change", function() {
                 method: "POST",
                 body: data
             }).then(response => response.json())
+            .then(job => job.error ? job : waitForJob(job.job_id, imageResponseDiv))
             .then(data => {
                 const answer = data.answer;
                 console.log("Image Description: " + answer);
                 
+                // Rate-limited or overloaded: show the retry message without storing it as an EHR
+                if (data.error) {
+                    const typingAnimation = imageResponseDiv.querySelector(".typing-animation");
+                    if (typingAnimation) {
+                        const pElement = document.createElement("p");
+                        pElement.classList.add("error");
+                        pElement.textContent = answer || "Error processing the file. Please try again.";
+                        typingAnimation.remove();
+                        imageResponseDiv.querySelector(".chat-details").appendChild(pElement);
+                    }
+                    return;
+                }
+                
                 // Check if this is a doctor's note
                 if (data.is_doctor_note) {
                     console.log("Doctor's note detected!");